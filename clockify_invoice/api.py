@@ -1,7 +1,17 @@
 from __future__ import annotations
 
+import gzip
+import hashlib
 import http.client
 import json
+import os
+import tempfile
+import time
+import urllib.parse
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+from datetime import timedelta
 from json.decoder import JSONDecodeError
 from types import TracebackType
 from typing import Any
@@ -10,13 +20,31 @@ from typing import Literal
 
 class ClockifySession:
     API_BASE_ENDPOINT = "https://api.clockify.me/api/v1"
+    MAX_RETRIES = 3
+    MAX_RETRY_AFTER = 30.0
+    # Seconds to wait on the socket so a hung API fails rather than hanging
+    TIMEOUT = 30.0
 
-    def __init__(self, api_key: str) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        cache_dir: str | None = None,
+        base_endpoint: str | None = None,
+    ) -> None:
         self.api_key = api_key
-        self.connection = http.client.HTTPSConnection("api.clockify.me")
+        self.cache_dir = cache_dir
+        self.base_endpoint = (base_endpoint or self.API_BASE_ENDPOINT).rstrip("/")
+        url = urllib.parse.urlsplit(self.base_endpoint)
+        connection_cls = (
+            http.client.HTTPConnection
+            if url.scheme == "http"
+            else http.client.HTTPSConnection
+        )
+        self.connection = connection_cls(url.netloc, timeout=self.TIMEOUT)
         self.headers = {
             "X-Api-key": self.api_key,
             "content-type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
             "Connection": "keep-alive",
         }
 
@@ -35,45 +63,196 @@ class ClockifySession:
         self.connection.close()
 
     def _request(
-        self, method: Literal["GET", "POST"], url: str
+        self,
+        method: Literal["GET", "POST"],
+        url: str,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
     ) -> http.client.HTTPResponse:
-        self.connection.request(method, url, headers=self.headers)
-        res = self.connection.getresponse()
+        for attempt in range(self.MAX_RETRIES + 1):
+            self.connection.request(
+                method, url, body, headers={**self.headers, **(headers or {})}
+            )
+            res = self.connection.getresponse()
+            if (
+                res.status != http.HTTPStatus.TOO_MANY_REQUESTS
+                or attempt == self.MAX_RETRIES
+            ):
+                break
+            # Rate limited, drain the body and back off for as long as asked
+            res.read()
+            time.sleep(self._retry_after(res, attempt))
+        if res.status == http.HTTPStatus.NOT_MODIFIED:
+            return res
         if res.status < 200 or res.status >= 300:
             # The response status code indicates an error
-            error_msg = f"{res.status} {res.reason}:{res.read().decode()}"
+            error_msg = f"{res.status} {res.reason}:{self._read(res).decode()}"
             raise http.client.HTTPException(error_msg)
         return res
 
-    def get(self, endpoint: str) -> Any:
-        """Performs a GET request to the clockify API and returns the JSON response."""
-        url = f"{self.API_BASE_ENDPOINT}/{endpoint}"
-        response = self._request("GET", url)
-        data = response.read().decode()
+    def _retry_after(self, response: http.client.HTTPResponse, attempt: int) -> float:
+        try:
+            delay = float(response.getheader("Retry-After") or "")
+        except ValueError:
+            delay = 2.0**attempt
+        return min(max(delay, 0.0), self.MAX_RETRY_AFTER)
+
+    @staticmethod
+    def _read(response: http.client.HTTPResponse) -> bytes:
+        """Reads the response body, decompressing it if the server encoded it."""
+        body = response.read()
+        encoding = (response.getheader("Content-Encoding") or "").lower()
+        if encoding == "gzip":
+            return gzip.decompress(body)
+        if encoding == "deflate":
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                # Some servers send a raw deflate stream without the zlib wrapper
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+        return body
+
+    def _json(self, response: http.client.HTTPResponse) -> Any:
+        data = self._read(response).decode()
         try:
             return json.loads(data)
         except JSONDecodeError:
             msg = f"Unable to parse response as JSON: '{data}'"
             raise APIResponseParseException(msg)
 
+    def _cache_path(self, url: str) -> str | None:
+        if self.cache_dir is None:
+            return None
+        key = hashlib.sha256(f"{self.api_key}:{url}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_cache(self, path: str | None) -> dict[str, Any] | None:
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                cached: dict[str, Any] = json.load(f)
+        except (OSError, JSONDecodeError):
+            return None
+        return cached
+
+    def _write_cache(self, path: str | None, entry: dict[str, Any]) -> None:
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def get(self, endpoint: str, cache: bool = False) -> Any:
+        """
+        Performs a GET request to the clockify API and returns the JSON response.
+
+        If cache is set and the session has a cache_dir the response is stored on
+        disk and revalidated with its ETag/Last-Modified on subsequent requests so
+        an unchanged resource costs a 304 rather than a full download.
+        """
+        url = f"{self.base_endpoint}/{endpoint}"
+        cache_path = self._cache_path(url) if cache else None
+        cached = self._read_cache(cache_path)
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self._request("GET", url, headers)
+        if response.status == http.HTTPStatus.NOT_MODIFIED:
+            # Drain the (empty) body so the connection can be reused
+            response.read()
+            if cached is not None:
+                return cached["body"]
+            raise http.client.HTTPException(f"Unexpected 304 for {url}")
+
+        body = self._json(response)
+        etag = response.getheader("ETag")
+        last_modified = response.getheader("Last-Modified")
+        if cache_path is not None and (etag or last_modified):
+            self._write_cache(
+                cache_path,
+                {"etag": etag, "last_modified": last_modified, "body": body},
+            )
+        return body
+
+    def post(self, endpoint: str, body: dict[str, Any]) -> Any:
+        """Performs a POST request with a JSON body and returns the JSON response"""
+        url = f"{self.base_endpoint}/{endpoint}"
+        response = self._request("POST", url, body=json.dumps(body).encode())
+        return self._json(response)
+
 
 class ClockifyClient:
     def __init__(self, session: ClockifySession) -> None:
         self.session = session
 
     def get_user(self) -> dict[str, Any]:
-        return self.session.get("user")
+        return self.session.get("user", cache=True)
 
     def get_workspaces(self) -> list[dict[str, Any]]:
-        return self.session.get("workspaces")
+        return self.session.get("workspaces", cache=True)
 
     def get_time_entries(
         self,
         workspace_id: str,
         user_id: str,
     ) -> list[dict[str, Any]]:
+        return [
+            te
+            for page in self.iter_time_entry_pages(workspace_id, user_id)
+            for te in page
+        ]
+
+    def iter_time_entry_pages(
+        self,
+        workspace_id: str,
+        user_id: str,
+        page_size: int = 1000,
+    ) -> Iterator[list[dict[str, Any]]]:
+        """Yields the user's time entries one page at a time"""
         path = f"workspaces/{workspace_id}/user/{user_id}/time-entries"
-        return self.session.get(path)
+        page = 1
+        while True:
+            entries = self.session.get(f"{path}?page={page}&page-size={page_size}")
+            if entries:
+                yield entries
+            if len(entries) < page_size:
+                return
+            page += 1
+
+    def get_summary_report(
+        self,
+        workspace_id: str,
+        user_id: str,
+        start: datetime,
+        end: datetime,
+    ) -> dict[str, Any]:
+        """
+        Returns the user's summary report for start (inclusive) to end (exclusive),
+        naive UTC datetimes, grouped by description then date. The session must be
+        for the reports API.
+        """
+        # The report's range is inclusive to the millisecond
+        end -= timedelta(milliseconds=1)
+        body = {
+            "dateRangeStart": f"{start.isoformat(timespec='milliseconds')}Z",
+            "dateRangeEnd": f"{end.isoformat(timespec='milliseconds')}Z",
+            "summaryFilter": {"groups": ["TIMEENTRY", "DATE"]},
+            "users": {"ids": [user_id], "contains": "CONTAINS", "status": "ALL"},
+            "amountShown": "HIDE_AMOUNT",
+            "exportType": "JSON",
+        }
+        report: dict[str, Any] = self.session.post(
+            f"workspaces/{workspace_id}/reports/summary", body
+        )
+        return report
 
 
 class ClockifyAPIException(Exception):
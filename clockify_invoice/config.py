@@ -7,6 +7,15 @@ from typing import Any
 
 from clockify_invoice.invoice import Client
 from clockify_invoice.invoice import Company
+from clockify_invoice.invoice import PDF_OPTIMIZATIONS
+from clockify_invoice.invoice import PDF_VARIANTS
+from clockify_invoice.invoice import PDFOptions
+
+# Where invoice time entries come from: the db kept current by synchs, or
+# clockify's summary report for the invoice period
+DATA_SOURCE_SYNCH = "synch"
+DATA_SOURCE_SUMMARY = "summary"
+DATA_SOURCES = (DATA_SOURCE_SYNCH, DATA_SOURCE_SUMMARY)
 
 
 class ConfigError(Exception):
@@ -22,10 +31,27 @@ class Config:
             raise ConfigError(f"Error in {config_file}: {e}")
 
         self.API_KEY = self._get_setting("api_key", os.getenv("CLOCKIFY_API_KEY"), True)
+        self.API_URL = self._get_setting(
+            "api_url", "https://api.clockify.me/api/v1", required=False
+        )
+        self.REPORTS_API_URL = self._get_setting(
+            "reports_api_url", "https://reports.api.clockify.me/v1", required=False
+        )
+        self.DATA_SOURCE = self._get_setting(
+            "data_source", DATA_SOURCE_SYNCH, required=False
+        )
+        if self.DATA_SOURCE not in DATA_SOURCES:
+            raise ConfigError(
+                f"Invalid data_source: {self.DATA_SOURCE}. "
+                f"Must be one of {DATA_SOURCES}"
+            )
         self.COMPANY = self._load_company_from_config()
         self.CLIENT = self._load_client_from_config()
         self._load_flask_config()
         self._load_mail_config()
+        self._load_webhook_config()
+        self._load_synch_config()
+        self.PDF_OPTIONS = self._load_pdf_config()
 
     def _get_setting(
         self,
@@ -89,3 +115,43 @@ class Config:
         self.FLASK_HOST = _get_flask_setting("host", default="0.0.0.0")
         self.FLASK_USER = _get_flask_setting("user", required=False)
         self.FLASK_PASSWORD = _get_flask_setting("password", required=False)
+
+    def _load_webhook_config(self) -> None:
+        _webhook_cfg = self._get_setting("webhook", default={})
+        _get_webhook_setting = functools.partial(self._get_setting, cfg=_webhook_cfg)
+        self.WEBHOOK_SECRET = _get_webhook_setting("secret", required=False)
+
+    def _load_synch_config(self) -> None:
+        _synch_cfg = self._get_setting("synch", default={})
+        _get_synch_setting = functools.partial(self._get_setting, cfg=_synch_cfg)
+        try:
+            self.SYNCH_INTERVAL_MINUTES = float(
+                _get_synch_setting("interval_minutes", default=0)
+            )
+            self.SYNCH_JITTER_SECONDS = float(
+                _get_synch_setting("jitter_seconds", default=0)
+            )
+        except ValueError as e:
+            raise ConfigError(f"Invalid synch schedule: {e}")
+        self.SYNCH_CRON = _get_synch_setting("cron", required=False)
+
+    def _load_pdf_config(self) -> PDFOptions:
+        _pdf_cfg = self._get_setting("pdf", default={})
+        _get_pdf_setting = functools.partial(self._get_setting, cfg=_pdf_cfg)
+        optimize_size = _get_pdf_setting(
+            "optimize_size", default=list(PDF_OPTIMIZATIONS), required=False
+        )
+        if not isinstance(optimize_size, list) or not set(optimize_size).issubset(
+            PDF_OPTIMIZATIONS
+        ):
+            raise ConfigError(
+                f"Invalid pdf optimize_size: {optimize_size}. "
+                f"Must be a list of {PDF_OPTIMIZATIONS}"
+            )
+        variant = _get_pdf_setting("variant", required=False) or None
+        if variant is not None and variant not in PDF_VARIANTS:
+            raise ConfigError(
+                f"Invalid pdf variant: {variant}. Must be one of {PDF_VARIANTS}"
+            )
+        version = _get_pdf_setting("version", required=False) or None
+        return PDFOptions(tuple(optimize_size), variant, version)
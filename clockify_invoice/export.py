@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import csv
+import datetime
+import io
+import json
+import zipfile
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from typing import Any
+
+TIME_ENTRY_FIELDS: tuple[str, ...] = (
+    "id",
+    "start_time",
+    "end_time",
+    "duration_seconds",
+    "description",
+)
+
+INVOICE_FIELDS: tuple[str, ...] = (
+    "invoice_id",
+    "number",
+    "date",
+    "period_start",
+    "period_end",
+    "payer",
+    "payee",
+    "total",
+    "paid",
+)
+
+ARCHIVE_MANIFEST_FIELDS: tuple[str, ...] = (
+    "invoice_id",
+    "number",
+    "file_name",
+    "period_start",
+    "period_end",
+    "total",
+)
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "zip": "application/zip",
+}
+
+
+def to_csv(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[str]:
+    """Lazily formats rows as CSV, yielding the header and then one line per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def _line(row: Sequence[Any]) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    yield _line(fields)
+    for row in rows:
+        yield _line(row)
+
+
+def to_ndjson(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[str]:
+    """Lazily formats rows as newline delimited JSON objects"""
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row))) + "\n"
+
+
+FORMATTERS: dict[
+    str, Callable[[Sequence[str], Iterable[Sequence[Any]]], Iterator[str]]
+] = {
+    "csv": to_csv,
+    "ndjson": to_ndjson,
+}
+
+
+class _ZipStream(io.RawIOBase):
+    """
+    An unseekable file object that buffers what zipfile writes to it until the
+    buffer is drained. zipfile uses data descriptors for unseekable files so each
+    member can be yielded as soon as it is written.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def to_zip(
+    files: Iterable[tuple[str, datetime.datetime, bytes]],
+    manifest: list[Sequence[Any]] | None = None,
+    manifest_fields: Sequence[str] = ARCHIVE_MANIFEST_FIELDS,
+) -> Iterator[bytes]:
+    """
+    Lazily writes (name, modified, data) files to a ZIP archive, yielding the
+    archive bytes as each file is written. If a manifest list is given it is
+    written as manifest.csv once all files have been consumed, so it can be filled
+    in while the files are generated.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w") as zf:
+        for name, modified, data in files:
+            info = zipfile.ZipInfo(name, modified.timetuple()[:6])
+            # PDFs are already compressed
+            zf.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+            yield stream.drain()
+        if manifest is not None:
+            zf.writestr(
+                "manifest.csv",
+                "".join(to_csv(manifest_fields, manifest)),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+    yield stream.drain()
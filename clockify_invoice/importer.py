@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import csv
+import functools
+import hashlib
+import json
+import os
+import re
+from collections.abc import Callable
+from collections.abc import Iterator
+from datetime import date
+from datetime import datetime
+from typing import Any
+from typing import TextIO
+
+from clockify_invoice.utils import convert_time_interval
+
+# The default date format of clockify's detailed report CSV export
+CSV_DATE_FORMAT = "%m/%d/%Y"
+CSV_TIME_FORMATS = ("%H:%M:%S", "%I:%M:%S %p", "%H:%M", "%I:%M %p")
+JSON_CHUNK_SIZE = 1 << 16
+_JSON_ENTRIES_KEY = re.compile(r'"time[eE]ntries"\s*:\s*\[')
+
+
+class TimeEntryImportError(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _format_date(value: str, date_format: str) -> str:
+    """Converts an export date to the ISO date used by the Store date format"""
+    try:
+        return datetime.strptime(value, date_format).date().isoformat()
+    except ValueError:
+        # Accept ISO dates whatever the configured format
+        return date.fromisoformat(value).isoformat()
+
+
+@functools.lru_cache(maxsize=1 << 17)
+def _format_time(value: str) -> str:
+    """Converts an export time to the HH:MM:SS used by the Store date format"""
+    for time_format in CSV_TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).time().isoformat("seconds")
+        except ValueError:
+            pass
+    raise ValueError(f"time data '{value}' does not match {CSV_TIME_FORMATS}")
+
+
+def _csv_entry_id(*fields: str) -> str:
+    """
+    CSV exports have no entry ids so one is derived from the entry itself, making
+    re-importing the same export idempotent
+    """
+    digest = hashlib.blake2b("\x1f".join(fields).encode(), digest_size=12)
+    return f"csv-{digest.hexdigest()}"
+
+
+def iter_csv_rows(
+    f: TextIO,
+    user_id: str,
+    workspace_id: str,
+    user_email: str | None = None,
+    date_format: str = CSV_DATE_FORMAT,
+) -> Iterator[tuple[Any, ...]]:
+    """
+    Lazily converts a clockify detailed report CSV export to time_entry rows.
+    The export's times are already in local time. If user_email is given entries
+    of other users are skipped.
+    """
+    reader = csv.reader(f)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    columns = {name.strip(): i for i, name in enumerate(header)}
+    try:
+        description = columns["Description"]
+        start_date, start_time = columns["Start Date"], columns["Start Time"]
+        end_date, end_time = columns["End Date"], columns["End Time"]
+    except KeyError as e:
+        raise TimeEntryImportError(f"Not a clockify detailed report CSV, no {e}")
+    email = columns.get("Email")
+    duration = columns.get("Duration (decimal)")
+    user_email = user_email.lower() if user_email else None
+
+    for line, record in enumerate(reader, 2):
+        if not record:
+            continue
+        if user_email and email is not None and record[email].lower() != user_email:
+            continue
+        try:
+            # Dates and times repeat a lot so are converted once each and cached
+            start_str = (
+                f"{_format_date(record[start_date], date_format)} "
+                f"{_format_time(record[start_time])}"
+            )
+            end_str = (
+                f"{_format_date(record[end_date], date_format)} "
+                f"{_format_time(record[end_time])}"
+            )
+            if duration is not None and record[duration]:
+                duration_seconds: float = round(float(record[duration]) * 3600)
+            else:
+                duration_seconds = (
+                    datetime.fromisoformat(end_str) - datetime.fromisoformat(start_str)
+                ).total_seconds()
+        except (ValueError, IndexError) as e:
+            raise TimeEntryImportError(f"Invalid entry on line {line}: {e}")
+        yield (
+            _csv_entry_id(
+                record[email] if email is not None else "",
+                start_str,
+                end_str,
+                record[description],
+            ),
+            start_str,
+            end_str,
+            duration_seconds,
+            record[description],
+            user_id,
+            workspace_id,
+        )
+
+
+def _iter_json_entries(f: TextIO) -> Iterator[dict[str, Any]]:
+    """
+    Incrementally decodes the time entries of a JSON export, either a list of
+    entries or a report object with a timeentries list, without loading the
+    whole file
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(JSON_CHUNK_SIZE)
+    eof = not buffer
+    stripped = buffer.lstrip()
+    if stripped.startswith("["):
+        pos = len(buffer) - len(stripped) + 1
+    else:
+        while (match := _JSON_ENTRIES_KEY.search(buffer)) is None and not eof:
+            chunk = f.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+        if match is None:
+            raise TimeEntryImportError("Not a clockify JSON export, no time entries")
+        pos = match.end()
+
+    while True:
+        # Skip to the next value, the end of the list or the end of the buffer
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            entry, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise TimeEntryImportError(f"Invalid JSON export: {e}")
+            chunk = f.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield entry
+        pos = end
+
+
+def iter_json_rows(
+    f: TextIO,
+    user_id: str,
+    workspace_id: str,
+    user_email: str | None = None,
+    date_format: str = CSV_DATE_FORMAT,
+) -> Iterator[tuple[Any, ...]]:
+    """
+    Lazily converts a clockify JSON export (a detailed report or time entries from
+    the API) to time_entry rows. Running timers are skipped. If user_email is given
+    entries of other users are skipped.
+    """
+    user_email = user_email.lower() if user_email else None
+    for te in _iter_json_entries(f):
+        email = te.get("userEmail")
+        if user_email and email and email.lower() != user_email:
+            continue
+        try:
+            entry_id = te.get("_id") or te["id"]
+            interval = te["timeInterval"]
+            if interval.get("end") is None:
+                continue
+            start_time, end_time, duration_secs = convert_time_interval(
+                interval["start"], interval["end"]
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise TimeEntryImportError(f"Invalid time entry {te}: {e}")
+        yield (
+            entry_id,
+            start_time,
+            end_time,
+            duration_secs,
+            te.get("description") or "",
+            user_id,
+            workspace_id,
+        )
+
+
+READERS: dict[str, Callable[..., Iterator[tuple[Any, ...]]]] = {
+    ".csv": iter_csv_rows,
+    ".json": iter_json_rows,
+}
+
+
+def iter_import_rows(
+    path: str,
+    user_id: str,
+    workspace_id: str,
+    user_email: str | None = None,
+    date_format: str = CSV_DATE_FORMAT,
+) -> Iterator[tuple[Any, ...]]:
+    """Lazily reads time_entry rows from a clockify export, by file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        reader = READERS[extension]
+    except KeyError:
+        raise TimeEntryImportError(
+            f"Unable to import '{path}', expected one of {', '.join(READERS)}"
+        )
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        yield from reader(f, user_id, workspace_id, user_email, date_format)
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import functools
+import sys
+from array import array
 from datetime import date
 from datetime import datetime
+from datetime import timedelta
 from typing import Any
 from typing import NamedTuple
 from typing import TYPE_CHECKING
@@ -16,11 +20,44 @@ if TYPE_CHECKING:
     from clockify_invoice.config import Config
 
 
+_EPOCH = datetime(1970, 1, 1)
+
+# Size optimisations and variants supported by weasyprint's write_pdf
+PDF_OPTIMIZATIONS = ("fonts", "images")
+PDF_VARIANTS = ("pdf/a-1b", "pdf/a-2b", "pdf/a-3b", "pdf/a-4b", "pdf/ua-1")
+
+
+class PDFOptions(NamedTuple):
+    optimize_size: tuple[str, ...] = PDF_OPTIMIZATIONS
+    variant: str | None = None
+    version: str | None = None
+
+
+# Only a few option sets are used (the configured ones and the defaults), older
+# caches are dropped with their images
+@functools.lru_cache(maxsize=4)
+def _image_cache(options: PDFOptions) -> dict[str, Any]:
+    """
+    The images loaded by weasyprint, shared by every pdf rendered with the options
+    so each image is fetched and decoded once. Images are optimised when loaded so
+    each set of options needs its own cache.
+    """
+    return {}
+
+
 class Invoice:
     """
     A Class representation of an Invoice with clockify line items
+
+    The line items are stored in columns (dates as seconds since the epoch, hours
+    and rates as double arrays and interned descriptions) which keeps them small
+    when pickled. The amounts and total are computed once when the time entries are
+    set rather than on every access.
     """
 
+    # Derived from the line item columns so not pickled
+    _DERIVED_ATTRS = ("_amounts", "_total", "_line_items")
+
     def __init__(
         self,
         invoice_number: int,
@@ -36,15 +73,45 @@ class Invoice:
         self.client = client
         self.period_start = period_start
         self.period_end = period_end
-        self._time_entries: list[TimeEntry] = []
+        self.time_entries = []
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if k not in self._DERIVED_ATTRS}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        # Invoices pickled before the columnar layout have a list of TimeEntry
+        time_entries = state.pop("_time_entries", None)
+        self.__dict__.update(state)
+        if time_entries is not None:
+            self.time_entries = time_entries
+        else:
+            self._compute_totals()
 
     @property
     def time_entries(self) -> list[TimeEntry]:
-        return self._time_entries
+        return [
+            TimeEntry(_EPOCH + timedelta(seconds=secs), desc, hours, rate)
+            for secs, desc, hours, rate in zip(
+                self._dates, self._descriptions, self._hours, self._rates
+            )
+        ]
 
     @time_entries.setter
     def time_entries(self, val: list[TimeEntry]) -> None:
-        self._time_entries = val
+        self._dates = array(
+            "q", (int((entry.date - _EPOCH).total_seconds()) for entry in val)
+        )
+        self._descriptions = [sys.intern(entry.description) for entry in val]
+        self._hours = array("d", (entry.duration_hours for entry in val))
+        self._rates = array("d", (entry.rate for entry in val))
+        self._compute_totals()
+
+    def _compute_totals(self) -> None:
+        self._amounts = array(
+            "d", (hours * rate for hours, rate in zip(self._hours, self._rates))
+        )
+        self._total = sum(self._amounts)
+        self._line_items: list[dict[str, Any]] | None = None
 
     @property
     def invoice_name(self) -> str:
@@ -54,20 +121,36 @@ class Invoice:
 
     @property
     def total(self) -> float:
-        return sum(entry.billable_amount for entry in self.time_entries)
-
-    def html(self, **kwargs: Any) -> str:
-        """Render the invoice html"""
-        return render_template("invoice.html", invoice=self.to_dict(), **kwargs)
+        return self._total
 
-    def pdf(self) -> bytes:
+    @property
+    def line_items(self) -> list[dict[str, Any]]:
+        """The time entries as dicts for rendering, built once per time entries"""
+        if self._line_items is None:
+            self._line_items = [
+                {**entry._asdict(), "billable_amount": amount}
+                for entry, amount in zip(self.time_entries, self._amounts)
+            ]
+        return self._line_items
+
+    def html(self, template: str = "invoice.html", **kwargs: Any) -> str:
+        """Render the invoice html, or a fragment of it with another template"""
+        return render_template(template, invoice=self.to_dict(), **kwargs)
+
+    def pdf(self, options: PDFOptions = PDFOptions()) -> bytes:
         html = HTML(
             string=self.html(
                 form_data={"display-form": "none"},
                 invoices_total=0,
             )
         )
-        ret = html.write_pdf(target=None)
+        ret = html.write_pdf(
+            target=None,
+            optimize_size=options.optimize_size,
+            variant=options.variant,
+            version=options.version,
+            image_cache=_image_cache(options),
+        )
         if not ret:
             raise ValueError("Error generating invoice pdf")
         return ret
@@ -80,20 +163,20 @@ class Invoice:
             "client": self.client._asdict(),
             "period_start": self.period_start,
             "period_end": self.period_end,
-            "time_entries": [entry._asdict() for entry in self.time_entries],
+            "time_entries": self.line_items,
             "total": self.total,
         }
 
     def pprint(self) -> None:
         table_data = [
             (
-                datetime.strftime(entry.date, "%d/%m/%Y"),
-                entry.description,
-                entry.duration_hours,
-                entry.rate,
-                entry.billable_amount,
+                datetime.strftime(item["date"], "%d/%m/%Y"),
+                item["description"],
+                item["duration_hours"],
+                item["rate"],
+                item["billable_amount"],
             )
-            for entry in self.time_entries
+            for item in self.line_items
         ]
         headers = ["Date", "Description", "Time Spent", "Rate", "Amount"]
         table_str = tabulate.tabulate(table_data, headers=headers)
@@ -125,7 +208,7 @@ class Invoice:
             f"Kind Regards,\n{self.company.name}"
         )
         email = Email(to, sender, subject, body, config)
-        email.attach_pdf(self.invoice_name, self.pdf())
+        email.attach_pdf(self.invoice_name, self.pdf(config.PDF_OPTIONS))
         return email
 
 
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+from typing import TYPE_CHECKING
+
+from clockify_invoice import profiling
+from clockify_invoice.utils import synch_with_clockify
+
+if TYPE_CHECKING:
+    from clockify_invoice.store import Store
+
+logger = logging.getLogger("clockify-invoice")
+
+
+class SynchJob:
+    """The state and progress of a synch running in a background thread"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self) -> None:
+        self.id = uuid.uuid4().hex
+        self.status = self.PENDING
+        self.pages_fetched = 0
+        self.rows_written = 0
+        self.error: str | None = None
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self._version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def _update(self, **kwargs: Any) -> None:
+        with self._changed:
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+            self._version += 1
+            self._changed.notify_all()
+
+    def progress(self, pages_fetched: int, rows_written: int) -> None:
+        self._update(pages_fetched=pages_fetched, rows_written=rows_written)
+
+    def run(self, store: Store, profile: bool = False) -> None:
+        """Runs the synch, profiling it if profile is set (see profiling.profile)"""
+        self._update(status=self.RUNNING, started_at=datetime.now())
+        profiler: contextlib.AbstractContextManager[Any]
+        if profile:
+            profiler = profiling.profile(store.profile_directory, f"synch-{self.id}")
+        else:
+            profiler = contextlib.nullcontext()
+        try:
+            with profiler:
+                synch_with_clockify(store, progress=self.progress)
+        except Exception as e:
+            logger.exception(f"Synch job [{self.id}] failed")
+            self._update(status=self.FAILED, error=str(e), finished_at=datetime.now())
+        else:
+            logger.info(f"Synch job [{self.id}] wrote {self.rows_written} time entries")
+            self._update(status=self.SUCCEEDED, finished_at=datetime.now())
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        Blocks until the job changes from the given version or the timeout expires.
+        Returns the current version.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "pages_fetched": self.pages_fetched,
+            "rows_written": self.rows_written,
+            "error": self.error,
+            "started_at": self.started_at and self.started_at.isoformat(),
+            "finished_at": self.finished_at and self.finished_at.isoformat(),
+        }
+
+
+class SynchJobs:
+    """
+    Runs synchs in background threads and keeps the most recent jobs so their
+    progress can be polled. Only one job runs at a time; starting a synch while
+    one is running returns the running job.
+    """
+
+    def __init__(self, max_jobs: int = 20) -> None:
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, SynchJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> SynchJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def start(self, store: Store, profile: bool = False) -> SynchJob:
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.finished:
+                    return job
+            job = SynchJob()
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        threading.Thread(
+            target=job.run,
+            args=(store, profile),
+            name=f"synch-{job.id}",
+            daemon=True,
+        ).start()
+        return job
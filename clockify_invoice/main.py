@@ -1,27 +1,66 @@
 import argparse
 import calendar as cal
+import contextlib
+import hashlib
+import hmac
 import io
+import json
 import logging
+import os
 import pickle
+import sys
+import uuid
+from collections.abc import Callable
+from collections.abc import Iterator
 from collections.abc import Sequence
 from datetime import date
 from datetime import datetime
 from typing import Any
 from typing import Literal
 
+import tabulate
 import werkzeug.wrappers
 from flask import Flask
+from flask import abort
+from flask import g
+from flask import jsonify
+from flask import make_response
 from flask import redirect
+from flask import render_template
 from flask import request
+from flask import Response
 from flask import send_file
 from flask import session
+from flask import stream_with_context
+from markupsafe import Markup
 
+from clockify_invoice import export
+from clockify_invoice import profiling
 from clockify_invoice.config import ConfigError
+from clockify_invoice.config import DATA_SOURCE_SUMMARY
+from clockify_invoice.importer import CSV_DATE_FORMAT
+from clockify_invoice.importer import iter_import_rows
+from clockify_invoice.importer import TimeEntryImportError
 from clockify_invoice.invoice import Invoice
+from clockify_invoice.invoice import TimeEntry
+from clockify_invoice.jobs import SynchJobs
+from clockify_invoice.scheduler import CronError
+from clockify_invoice.scheduler import scheduler_from_config
+from clockify_invoice.store import ArchiveError
+from clockify_invoice.store import HIGHLIGHT_END
+from clockify_invoice.store import HIGHLIGHT_START
+from clockify_invoice.store import InvoiceNumberError
+from clockify_invoice.store import SearchError
 from clockify_invoice.store import Store
+from clockify_invoice.utils import apply_time_entry_event
 from clockify_invoice.utils import auth_required
+from clockify_invoice.utils import compress_response
+from clockify_invoice.utils import etag_matches
+from clockify_invoice.utils import get_invoice_time_entries
 from clockify_invoice.utils import get_period_dates
+from clockify_invoice.utils import SummaryReportError
 from clockify_invoice.utils import synch_with_clockify
+from clockify_invoice.utils import SynchInProgress
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,13 +70,22 @@ logging.basicConfig(
 logger = logging.getLogger("clockify-invoice")
 
 app = Flask(__name__)
+app.after_request(compress_response)
+synch_jobs = SynchJobs()
 
 # Constants
 TODAY = date.today()
 YEARS = tuple(range(TODAY.year, TODAY.year - 5, -1))
 MONTHS = tuple(cal.month_name[1:])
 FLASK_CONFIG_STORE_KEY = "store"
+FLASK_CONFIG_PROFILE_KEY = "profile-requests"
 PDF_MIME_TYPE = "application/pdf"
+EXPORT_START = date(1970, 1, 1)
+EXPORT_END = date(9999, 12, 31)
+SEARCH_PAGE_SIZE = 50
+# Changes every restart so pages rendered with a previous config or templates
+# are never revalidated
+ETAG_SALT = uuid.uuid4().hex
 
 
 @app.template_filter("format_financial_year")
@@ -52,11 +100,100 @@ def format_date(value: date, format: str = "%d/%m/%Y") -> str:
     return value.strftime(format)
 
 
+@app.template_filter("highlight")
+def highlight(value: str) -> Markup:
+    return (
+        Markup.escape(value)
+        .replace(HIGHLIGHT_START, Markup("<mark>"))
+        .replace(HIGHLIGHT_END, Markup("</mark>"))
+    )
+
+
+@app.before_request
+def start_request_profile() -> None:
+    """
+    Profiles the request if it has a profile query parameter and the server was
+    started with --profile and --debug
+    """
+    if app.config.get(FLASK_CONFIG_PROFILE_KEY) and "profile" in request.args:
+        g.profiler = profiling.start_profile()
+
+
+@app.after_request
+def finish_request_profile(
+    response: werkzeug.wrappers.Response,
+) -> werkzeug.wrappers.Response:
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+        path = profiling.stop_profile(
+            profiler, store.profile_directory, f"request-{request.endpoint}"
+        )
+        response.headers["X-Profile"] = os.path.basename(path)
+    return response
+
+
+@app.teardown_request
+def abandon_request_profile(error: BaseException | None = None) -> None:
+    """
+    Stops and writes the profile of a request that finish_request_profile never
+    saw, e.g. because the view raised, so the profiler isn't left enabled on the
+    worker thread
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+        profiling.stop_profile(
+            profiler, store.profile_directory, f"request-{request.endpoint}-error"
+        )
+
+
+def cache_privately(
+    response: werkzeug.wrappers.Response, etag: str, weak: bool = False
+) -> werkzeug.wrappers.Response:
+    """
+    Sets the etag and has browsers (but not shared caches) keep the response
+    and revalidate it on every use
+    """
+    response.set_etag(etag, weak)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag: str, weak: bool = False) -> werkzeug.wrappers.Response:
+    return cache_privately(Response(status=304), etag, weak)
+
+
+def invoice_page_etag(
+    generation: int, invoice_pickle: bytes | None, form_data: dict[str, Any]
+) -> str:
+    """
+    Returns the etag of the invoice page rendered from the session's invoice and
+    form data with the db at the given generation
+    """
+    key = hashlib.sha256(f"{ETAG_SALT}:{generation}:".encode())
+    key.update(json.dumps(form_data, sort_keys=True, default=str).encode())
+    key.update(invoice_pickle or b"")
+    return key.hexdigest()
+
+
+def release_session_reservation(store: Store) -> None:
+    """Releases the session's reserved invoice number so the sequence reuses it"""
+    number = session.pop("invoice-number", None)
+    if number is not None:
+        store.release_invoice_number(number)
+
+
 @app.route("/delete_invoice/<int:invoice_id>", methods=["POST"])
 @auth_required
 def delete_invoice(invoice_id: int) -> werkzeug.wrappers.Response:
     store: Store = app.config[FLASK_CONFIG_STORE_KEY]
-    store.delete_invoice(invoice_id)
+    try:
+        store.delete_invoice(invoice_id)
+    except ArchiveError as e:
+        logger.warning(e)
+        session["error"] = f"{e} and can't be deleted"
     session["active-tab"] = "table-tab"
     return redirect("/")
 
@@ -68,8 +205,20 @@ def save() -> werkzeug.wrappers.Response:
         return redirect("/")
     invoice: Invoice = pickle.loads(session["invoice"])
     store: Store = app.config[FLASK_CONFIG_STORE_KEY]
-    store.save_invoice(invoice)
     session["active-tab"] = "form-tab"
+    try:
+        store.save_invoice(invoice)
+    except InvoiceNumberError as e:
+        logger.warning(e)
+        session["error"] = f"{e}. A new number has been reserved."
+        release_session_reservation(store)
+        session["invoice-number"] = store.reserve_invoice_number()
+        return redirect("/")
+    # The reservation has been used, or the invoice was saved under a manually
+    # entered number, the next page load reserves a new one
+    if session.get("invoice-number") != invoice.invoice_number:
+        release_session_reservation(store)
+    session.pop("invoice-number", None)
     return redirect("/")
 
 
@@ -79,14 +228,44 @@ def download() -> werkzeug.wrappers.Response:
     session["active-tab"] = "form-tab"
     if "invoice" not in session:
         return redirect("/")
+    # Rendering the pdf is expensive, skip it if the browser has this invoice.
+    # Rendered pdfs are equivalent but not byte identical so the etag is weak.
+    etag = hashlib.sha256(ETAG_SALT.encode() + session["invoice"]).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag, weak=True)
     invoice: Invoice = pickle.loads(session["invoice"])
-    pdf_bytes = invoice.pdf()
-    return send_file(
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    pdf_bytes = invoice.pdf(store.config.PDF_OPTIONS)
+    response = send_file(
         io.BytesIO(pdf_bytes),
         PDF_MIME_TYPE,
         True,
         invoice.invoice_name,
+        etag=False,
+    )
+    return cache_privately(response, etag, weak=True)
+
+
+@app.route("/invoice/<int:invoice_id>/pdf", methods=["GET"])
+@auth_required
+def invoice_pdf(invoice_id: int) -> werkzeug.wrappers.Response:
+    """Serves the stored pdf of a saved invoice"""
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    saved = store.get_invoice_pdf(invoice_id)
+    if saved is None:
+        abort(404)
+    invoice, saved_at, pdf_bytes = saved
+    response = send_file(
+        io.BytesIO(pdf_bytes),
+        PDF_MIME_TYPE,
+        download_name=invoice.invoice_name,
+        # Ids can be reused (e.g. by a recreated db) so the etag is of the content
+        etag=hashlib.sha256(pdf_bytes).hexdigest(),
+        last_modified=saved_at,
     )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.route("/email", methods=["GET"])
@@ -102,10 +281,72 @@ def email() -> werkzeug.wrappers.Response:
     return redirect("/")
 
 
+def invoice_time_entries(
+    store: Store, start: date, end: date, refresh: bool = False
+) -> list[TimeEntry]:
+    """
+    get_invoice_time_entries remembered for the rest of the request, so a page
+    that needs the period's entries more than once fetches its summary report (or
+    fails to) only once. If a refresh fails the cached summary is remembered.
+    """
+    results = g.setdefault("invoice_time_entries", {})
+    if refresh or (start, end) not in results:
+        try:
+            results[start, end] = get_invoice_time_entries(store, start, end, refresh)
+        except SummaryReportError as e:
+            cached = None
+            if refresh:
+                cached = store.get_period_summary(start, end, allow_stale=True)
+            results[start, end] = e if cached is None else cached
+            raise
+    result = results[start, end]
+    if isinstance(result, SummaryReportError):
+        raise result
+    return result
+
+
+def update_session_invoice(
+    store: Store, year: int, month: int, invoice_number: int
+) -> Invoice:
+    """
+    Updates the session's draft invoice (creating it if needed) for the month and
+    number and loads its time entries. If they can't be loaded the invoice has
+    none and the error is left in the session.
+    """
+    period_start, period_end = get_period_dates(year, month)
+    if "invoice" in session:
+        invoice: Invoice = pickle.loads(session["invoice"])
+        invoice.invoice_number = invoice_number
+        invoice.period_start = period_start
+        invoice.period_end = period_end
+    else:
+        invoice = Invoice(
+            invoice_number,
+            store.config.COMPANY,
+            store.config.CLIENT,
+            period_start,
+            period_end,
+        )
+
+    try:
+        invoice.time_entries = invoice_time_entries(
+            store, invoice.period_start, invoice.period_end
+        )
+    except SummaryReportError as e:
+        logger.error(e)
+        invoice.time_entries = []
+        session["error"] = str(e)
+
+    session["invoice"] = pickle.dumps(invoice)
+    return invoice
+
+
 @app.route("/", methods=["GET", "POST"])
 @auth_required
-def process_invoice() -> str:
+def process_invoice() -> werkzeug.wrappers.Response:
     store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    if "invoice-number" not in session:
+        session["invoice-number"] = store.reserve_invoice_number()
     form_data: dict[str, Any] = {
         "months": MONTHS,
         "years": YEARS,
@@ -113,41 +354,262 @@ def process_invoice() -> str:
         "year": TODAY.year,
         "financial-year": TODAY.year - 1,
         "display-form": "block",
-        "invoice-number": store.get_next_invoice_number(),
+        "invoice-number": session["invoice-number"],
         "active-tab": session.get("active-tab") or "form-tab",
+        "error": session.pop("error", None),
+        "synch-job": None,
+        "data-source": store.config.DATA_SOURCE,
     }
 
+    synch_job = synch_jobs.get(session.get("synch-job", ""))
+    if synch_job is not None and synch_job.finished:
+        session.pop("synch-job")
+        if synch_job.status == synch_job.FAILED:
+            form_data["error"] = f"Synch failed: {synch_job.error}"
+    elif synch_job is not None:
+        form_data["synch-job"] = synch_job.id
+
     if request.method == "POST":
         form_data.update(request.form)
 
-    start_year, start_month = int(form_data["year"]), int(form_data["month"])
-    period_start, period_end = get_period_dates(start_year, start_month)
+    if request.method == "GET" and store.config.DATA_SOURCE == DATA_SOURCE_SUMMARY:
+        # Refetching a stale summary bumps the generation so must come first
+        period = get_period_dates(int(form_data["year"]), int(form_data["month"]))
+        with contextlib.suppress(SummaryReportError):
+            invoice_time_entries(store, *period)
+    generation = store.get_generation()
+    if request.method == "GET" and etag_matches(
+        etag := invoice_page_etag(generation, session.get("invoice"), form_data)
+    ):
+        return not_modified(etag)
+
+    invoice = update_session_invoice(
+        store,
+        int(form_data["year"]),
+        int(form_data["month"]),
+        int(form_data["invoice-number"]),
+    )
+    form_data["error"] = session.pop("error", None) or form_data["error"]
+    invoices = store.get_invoices(int(form_data["financial-year"]))
+    invoices_total = sum(invoice["total"] for invoice in invoices)
+    response = make_response(
+        invoice.html(
+            form_data=form_data, invoices=invoices, invoices_total=invoices_total
+        )
+    )
+    if request.method == "GET":
+        etag = invoice_page_etag(generation, session["invoice"], form_data)
+        cache_privately(response, etag)
+    return response
 
-    invoice_number = int(form_data["invoice-number"])
 
-    if "invoice" in session:
-        invoice: Invoice = pickle.loads(session["invoice"])
-        invoice.invoice_number = invoice_number
-        invoice.period_start = period_start
-        invoice.period_end = period_end
+@app.route("/refresh_summary", methods=["POST"])
+@auth_required
+def refresh_summary() -> werkzeug.wrappers.Response:
+    """Refetches the summary report of the form's month, then previews it"""
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    try:
+        period = get_period_dates(int(request.form["year"]), int(request.form["month"]))
+    except (KeyError, ValueError):
+        abort(400)
+    try:
+        invoice_time_entries(store, *period, refresh=True)
+    except SummaryReportError as e:
+        logger.error(e)
+        session["error"] = str(e)
+    session["active-tab"] = "form-tab"
+    return process_invoice()
+
+
+@app.route("/fragments/invoice", methods=["POST"])
+@auth_required
+def invoice_preview_fragment() -> str:
+    """Updates the draft invoice from the form and renders only its preview"""
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    try:
+        year = int(request.form["year"])
+        month = int(request.form["month"])
+        invoice_number = int(request.form["invoice-number"])
+    except (KeyError, ValueError):
+        abort(400)
+    invoice = update_session_invoice(store, year, month, invoice_number)
+    if "error" in session:
+        # The page falls back to a full submit, which shows the error
+        abort(502)
+    return invoice.html("invoice_preview.html", form_data={"display-form": "block"})
+
+
+def financial_year_fragment(
+    template: str, load_context: Callable[[Store, int], dict[str, Any]]
+) -> werkzeug.wrappers.Response:
+    """
+    Renders a fragment of the financial year's invoice history with the context
+    loaded for the financial year. The fragments only change with the db so they
+    are revalidated against the db generation.
+    """
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    financial_year = request.args.get("financial-year", TODAY.year - 1, type=int)
+    key = f"{ETAG_SALT}:{store.get_generation()}:{template}:{financial_year}"
+    etag = hashlib.sha256(key.encode()).hexdigest()
+    if etag_matches(etag):
+        return not_modified(etag)
+    context = load_context(store, financial_year)
+    response = make_response(render_template(template, **context))
+    return cache_privately(response, etag)
+
+
+@app.route("/fragments/history", methods=["GET"])
+@auth_required
+def invoice_history_fragment() -> werkzeug.wrappers.Response:
+    return financial_year_fragment(
+        "invoice_history.html",
+        lambda store, financial_year: {"invoices": store.get_invoices(financial_year)},
+    )
+
+
+@app.route("/fragments/totals", methods=["GET"])
+@auth_required
+def invoice_totals_fragment() -> werkzeug.wrappers.Response:
+    return financial_year_fragment(
+        "invoice_totals.html",
+        lambda store, financial_year: {
+            "invoices_total": store.get_invoices_total(financial_year)
+        },
+    )
+
+
+@app.route("/dashboard", methods=["GET"])
+@auth_required
+def dashboard() -> str:
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    financial_year = request.args.get("financial-year", TODAY.year - 1, type=int)
+    return render_template(
+        "dashboard.html",
+        years=YEARS,
+        financial_year=financial_year,
+        dashboard=store.get_dashboard(financial_year),
+    )
+
+
+def iter_export(
+    store: Store,
+    kind: Literal["time-entries", "invoices"],
+    format: Literal["csv", "ndjson"],
+    start: date,
+    end: date,
+) -> Iterator[str]:
+    if kind == "time-entries":
+        fields, rows = export.TIME_ENTRY_FIELDS, store.iter_time_entries(start, end)
     else:
-        invoice = Invoice(
-            invoice_number,
-            store.config.COMPANY,
-            store.config.CLIENT,
-            period_start,
-            period_end,
-        )
+        fields, rows = export.INVOICE_FIELDS, store.iter_invoice_summaries(start, end)
+    return export.FORMATTERS[format](fields, rows)
 
-    invoice.time_entries = store.get_time_entries(
-        invoice.period_start, invoice.period_end
+
+@app.route(
+    "/export/<any('time-entries', 'invoices'):kind>.<any(csv, ndjson):format>",
+    methods=["GET"],
+)
+@auth_required
+def export_data(
+    kind: Literal["time-entries", "invoices"], format: Literal["csv", "ndjson"]
+) -> werkzeug.wrappers.Response:
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    try:
+        start = date.fromisoformat(request.args.get("start", EXPORT_START.isoformat()))
+        end = date.fromisoformat(request.args.get("end", EXPORT_END.isoformat()))
+    except ValueError:
+        abort(400)
+    return Response(
+        stream_with_context(iter_export(store, kind, format, start, end)),
+        mimetype=export.MIME_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename={kind}_{start}_{end}.{format}"
+        },
     )
 
-    session["invoice"] = pickle.dumps(invoice)
-    invoices = store.get_invoices(int(form_data["financial-year"]))
-    invoices_total = sum(invoice["total"] for invoice in invoices)
-    return invoice.html(
-        form_data=form_data, invoices=invoices, invoices_total=invoices_total
+
+def iter_archive(store: Store, financial_year: int) -> Iterator[bytes]:
+    """Streams a ZIP of every saved invoice pdf in the year plus a CSV manifest"""
+    manifest: list[Sequence[Any]] = []
+
+    def _files() -> Iterator[tuple[str, datetime, bytes]]:
+        for invoice_id, invoice, pdf_bytes in store.iter_invoice_pdfs(financial_year):
+            manifest.append(
+                (
+                    invoice_id,
+                    invoice.invoice_number,
+                    invoice.invoice_name,
+                    invoice.period_start,
+                    invoice.period_end,
+                    invoice.total,
+                )
+            )
+            invoice_datetime = datetime.combine(
+                invoice.invoice_date, datetime.min.time()
+            )
+            yield invoice.invoice_name, invoice_datetime, pdf_bytes
+
+    return export.to_zip(_files(), manifest)
+
+
+@app.route("/archive/<int:financial_year>", methods=["GET"])
+@auth_required
+def archive(financial_year: int) -> werkzeug.wrappers.Response:
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    file_name = f"invoices_{format_financial_year(financial_year)}.zip"
+    return Response(
+        stream_with_context(iter_archive(store, financial_year)),
+        mimetype=export.MIME_TYPES["zip"],
+        headers={"Content-Disposition": f"attachment; filename={file_name}"},
+    )
+
+
+@app.route("/webhooks/clockify", methods=["POST"])
+def clockify_webhook() -> werkzeug.wrappers.Response:
+    """
+    Receives clockify time entry webhooks. Clockify authenticates each request by
+    sending the webhook's signing secret in the Clockify-Signature header.
+    """
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    secret = store.config.WEBHOOK_SECRET
+    if not secret:
+        abort(404)
+    signature = request.headers.get("Clockify-Signature", "")
+    if not hmac.compare_digest(signature.encode(), secret.encode()):
+        abort(401)
+    event_type = request.headers.get("Clockify-Webhook-Event-Type", "")
+    time_entry = request.get_json(silent=True)
+    if not isinstance(time_entry, dict) or "id" not in time_entry:
+        abort(400)
+    try:
+        apply_time_entry_event(store, event_type, time_entry)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Invalid {event_type} webhook payload: {e}")
+        abort(400)
+    return Response(status=204)
+
+
+@app.route("/search", methods=["GET"])
+@auth_required
+def search() -> str:
+    store: Store = app.config[FLASK_CONFIG_STORE_KEY]
+    query = request.args.get("q", "")
+    page = max(request.args.get("page", 1, type=int), 1)
+    error = None
+    try:
+        # Fetch one extra result to know if there is a next page
+        results = store.search_time_entries(
+            query, SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE
+        )
+    except SearchError as e:
+        results, error = [], str(e)
+    return render_template(
+        "search.html",
+        query=query,
+        page=page,
+        results=results[:SEARCH_PAGE_SIZE],
+        has_next=len(results) > SEARCH_PAGE_SIZE,
+        error=error,
     )
 
 
@@ -155,24 +617,79 @@ def process_invoice() -> str:
 @auth_required
 def synch() -> werkzeug.wrappers.Response:
     store = app.config[FLASK_CONFIG_STORE_KEY]
-    synch_with_clockify(store)
-    session["active-table"] = "form-tab"
+    # The synch runs in the background, outside the request's profile
+    job = synch_jobs.start(store, profile="profiler" in g)
+    session["synch-job"] = job.id
+    session["active-tab"] = "form-tab"
     return redirect("/")
 
 
-def run_interactive(store: Store, debug: bool = False) -> int:
+@app.route("/synch/<job_id>", methods=["GET"])
+@auth_required
+def synch_status(job_id: str) -> werkzeug.wrappers.Response:
+    job = synch_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@app.route("/synch/<job_id>/events", methods=["GET"])
+@auth_required
+def synch_events(job_id: str) -> werkzeug.wrappers.Response:
+    """Streams the job's progress as Server-Sent Events until it finishes"""
+    job = synch_jobs.get(job_id)
+    if job is None:
+        abort(404)
+
+    def _events() -> Iterator[str]:
+        version = -1
+        while True:
+            # Times out periodically to send the current state as a keep-alive
+            version = job.wait_for_change(version, timeout=15)
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.finished:
+                return
+
+    return Response(
+        _events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def run_interactive(
+    store: Store, debug: bool = False, profile_requests: bool = False
+) -> int:
     app.secret_key = store.config.API_KEY
     app.config[FLASK_CONFIG_STORE_KEY] = store
-    app.run(store.config.FLASK_HOST, store.config.FLASK_PORT, debug=debug)
+    app.config[FLASK_CONFIG_PROFILE_KEY] = profile_requests
+    try:
+        scheduler = scheduler_from_config(store)
+    except CronError as e:
+        logger.error(e)
+        return 1
+    if scheduler is not None:
+        scheduler.start()
+    try:
+        app.run(store.config.FLASK_HOST, store.config.FLASK_PORT, debug=debug)
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
     return 0
 
 
 def generate_invoice(
-    store: Store, year: int, month: Literal[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+    store: Store,
+    year: int,
+    month: Literal[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+    refresh: bool = False,
 ) -> int:
     workspace_id = store.get_workspace_id()
     user_id = store.get_user_id()
-    if not (workspace_id and user_id):
+    # Summaries are fetched for whichever user the api key belongs to
+    if store.config.DATA_SOURCE != DATA_SOURCE_SUMMARY and not (
+        workspace_id and user_id
+    ):
         logger.error(
             f"Unable to generate invoice: Invalid User ({user_id}) or "
             f"Workspace ({workspace_id}). Try running --synch first."
@@ -188,11 +705,82 @@ def generate_invoice(
         period_start,
         period_end,
     )
-    invoice.time_entries = store.get_time_entries(period_start, period_end)
+    try:
+        invoice.time_entries = get_invoice_time_entries(
+            store, period_start, period_end, refresh
+        )
+    except SummaryReportError as e:
+        logger.error(e)
+        return 1
     invoice.pprint()
     return 0
 
 
+def export_to_stdout(
+    store: Store,
+    kind: Literal["time-entries", "invoices"],
+    format: Literal["csv", "ndjson"],
+    start: date,
+    end: date,
+) -> int:
+    for chunk in iter_export(store, kind, format, start, end):
+        sys.stdout.write(chunk)
+    return 0
+
+
+def search_time_entries(store: Store, query: str) -> int:
+    try:
+        results = store.search_time_entries(query, SEARCH_PAGE_SIZE)
+    except SearchError as e:
+        logger.error(e)
+        return 1
+    table_data = [
+        (
+            format_date(result["date"]),
+            result["duration_hours"],
+            result["description"]
+            .replace(HIGHLIGHT_START, "")
+            .replace(HIGHLIGHT_END, ""),
+            result["invoice_number"] or "",
+        )
+        for result in results
+    ]
+    headers = ["Date", "Time Spent", "Description", "Invoice #"]
+    print(tabulate.tabulate(table_data, headers=headers, floatfmt=".2f"))
+    return 0
+
+
+def archive_to_file(store: Store, financial_year: int, output: str | None) -> int:
+    output = output or f"invoices_{format_financial_year(financial_year)}.zip"
+    with open(output, "wb") as f:
+        for chunk in iter_archive(store, financial_year):
+            f.write(chunk)
+    logger.info(f"Wrote invoice archive to {output}")
+    return 0
+
+
+def partition_financial_year(store: Store, financial_year: int) -> int:
+    try:
+        store.archive_financial_year(financial_year)
+    except ArchiveError as e:
+        logger.error(e)
+        return 1
+    return 0
+
+
+def import_time_entries(store: Store, paths: list[str], date_format: str) -> int:
+    user_id, workspace_id, user_email = store.get_or_create_import_user()
+    for path in paths:
+        rows = iter_import_rows(path, user_id, workspace_id, user_email, date_format)
+        try:
+            loaded = store.import_time_entries(rows)
+        except (OSError, TimeEntryImportError) as e:
+            logger.error(e)
+            return 1
+        logger.info(f"Imported {loaded} time entries from '{path}'")
+    return 0
+
+
 def main(argv: Sequence[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Clockify Invoice Command Line Tool")
     parser.add_argument(
@@ -233,6 +821,80 @@ def main(argv: Sequence[str] | None = None) -> int:
         choices=range(1, 13),
         help="invoice period month between 1-12 (%(default)s)",
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="refetch the period's summary report rather than using the cached one",
+    )
+
+    parser.add_argument(
+        "--export",
+        choices=("time-entries", "invoices"),
+        help="write time entries or invoice summaries to stdout",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("csv", "ndjson"),
+        default="csv",
+        help="export format (%(default)s)",
+    )
+    parser.add_argument(
+        "--start",
+        type=date.fromisoformat,
+        default=EXPORT_START,
+        metavar="YYYY-MM-DD",
+        help="export period start, inclusive",
+    )
+    parser.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        default=EXPORT_END,
+        metavar="YYYY-MM-DD",
+        help="export period end, exclusive",
+    )
+    parser.add_argument(
+        "--search",
+        metavar="QUERY",
+        help="search time entry descriptions, showing the latest matches",
+    )
+    parser.add_argument(
+        "--archive",
+        type=int,
+        metavar="FINANCIAL_YEAR",
+        help="write a ZIP of all saved invoice pdfs in the financial year",
+    )
+    parser.add_argument(
+        "--partition",
+        type=int,
+        metavar="FINANCIAL_YEAR",
+        help="move a closed financial year into its own archive database",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="archive output path (invoices_<financial year>.zip)",
+    )
+    parser.add_argument(
+        "--import",
+        nargs="+",
+        dest="import_files",
+        metavar="FILE",
+        help="load time entries from clockify detailed report CSV/JSON exports",
+    )
+    parser.add_argument(
+        "--date-format",
+        default=CSV_DATE_FORMAT,
+        help="date format of imported CSV exports (%(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "profile the command, writing pstats files to the store directory. "
+            "With -i and --debug profiles requests with a 'profile' query "
+            "parameter instead"
+        ),
+    )
 
     args = parser.parse_args(argv)
 
@@ -245,14 +907,39 @@ def main(argv: Sequence[str] | None = None) -> int:
         logger.error(e)
         return 1
 
-    ret = 0
-    # First synch the db if the flag is set
-    if args.synch:
-        ret = synch_with_clockify(store)
-    if args.interactive_mode:
-        ret |= run_interactive(store)
+    profiler: contextlib.AbstractContextManager[Any]
+    if args.profile and not args.interactive_mode:
+        profiler = profiling.profile(store.profile_directory, "cli")
     else:
-        ret |= generate_invoice(store, args.year, args.month)
+        profiler = contextlib.nullcontext()
+
+    ret = 0
+    with profiler:
+        # First synch the db if the flag is set
+        if args.synch:
+            try:
+                ret = synch_with_clockify(store, blocking=False)
+            except SynchInProgress:
+                logger.info("Waiting for another synch to finish...")
+                ret = synch_with_clockify(store)
+        if args.import_files:
+            ret |= import_time_entries(store, args.import_files, args.date_format)
+        elif args.export:
+            ret |= export_to_stdout(
+                store, args.export, args.format, args.start, args.end
+            )
+        elif args.search:
+            ret |= search_time_entries(store, args.search)
+        elif args.archive is not None:
+            ret |= archive_to_file(store, args.archive, args.output)
+        elif args.partition is not None:
+            ret |= partition_financial_year(store, args.partition)
+        elif args.interactive_mode:
+            if args.profile and not args.debug:
+                logger.warning("Requests are only profiled with --debug")
+            ret |= run_interactive(store, profile_requests=args.profile and args.debug)
+        else:
+            ret |= generate_invoice(store, args.year, args.month, args.refresh)
     return ret
 
 
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+from collections import defaultdict
+from collections.abc import Generator
+from datetime import datetime
+from typing import Any
+
+logger = logging.getLogger("clockify-invoice")
+
+# Number of functions listed in a profile summary
+SUMMARY_LIMIT = 15
+# Deepest call path followed in a profile summary
+HOT_PATH_DEPTH = 20
+
+
+def start_profile() -> cProfile.Profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler: cProfile.Profile, directory: str, name: str) -> str:
+    """
+    Stops the profiler and writes its stats to a timestamped .pstats file in the
+    directory, logging a summary of where the time went. Returns the file path.
+    The file can be explored with snakeviz or turned into a flamegraph with
+    flameprof.
+    """
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    safe_name = re.sub(r"[^\w.-]+", "_", name)
+    path = os.path.join(
+        directory, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{safe_name}.pstats"
+    )
+    profiler.dump_stats(path)
+    logger.info(f"Profile of {name} written to {path}\n{summarise(profiler)}")
+    return path
+
+
+@contextlib.contextmanager
+def profile(directory: str, name: str) -> Generator[cProfile.Profile, None, None]:
+    """Profiles the body of the with statement, see stop_profile"""
+    profiler = start_profile()
+    try:
+        yield profiler
+    finally:
+        stop_profile(profiler, directory, name)
+
+
+def _hot_path(stats: pstats.Stats) -> list[tuple[Any, float]]:
+    """
+    Follows the most expensive callee from the most expensive entry point,
+    returning the functions on the path with their cumulative time
+    """
+    # Each function's stats are (calls, primitive calls, tottime, cumtime, callers)
+    all_stats: dict[Any, Any] = stats.stats  # type: ignore[attr-defined]
+    callees: defaultdict[Any, dict[Any, float]] = defaultdict(dict)
+    for func, (*_, callers) in all_stats.items():
+        for caller, caller_stats in callers.items():
+            callees[caller][func] = caller_stats[3]
+    roots = [func for func, (*_, callers) in all_stats.items() if not callers]
+    if not roots:
+        return []
+    func = max(roots, key=lambda f: all_stats[f][3])
+    path = [(func, all_stats[func][3])]
+    seen = {func}
+    while callees[func] and len(path) < HOT_PATH_DEPTH:
+        func, cumtime = max(callees[func].items(), key=lambda item: item[1])
+        if func in seen:
+            break
+        seen.add(func)
+        path.append((func, cumtime))
+    return path
+
+
+def _format_func(func: tuple[str, int, str]) -> str:
+    file_name, line, name = func
+    if file_name == "~" and line == 0:
+        # A builtin
+        return name
+    return f"{file_name}:{line}({name})"
+
+
+def summarise(profiler: cProfile.Profile, limit: int = SUMMARY_LIMIT) -> str:
+    """Returns the slowest call path and the slowest functions by cumulative time"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream).strip_dirs()
+    stream.write("Slowest call path (cumulative seconds):\n")
+    for depth, (func, cumtime) in enumerate(_hot_path(stats)):
+        stream.write(f"{cumtime:10.3f}  {'  ' * depth}{_format_func(func)}\n")
+    stream.write("\n")
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+from datetime import datetime
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+from clockify_invoice.utils import synch_with_clockify
+from clockify_invoice.utils import SynchInProgress
+
+if TYPE_CHECKING:
+    from clockify_invoice.store import Store
+
+logger = logging.getLogger("clockify-invoice")
+
+
+class CronError(Exception):
+    pass
+
+
+def _seconds_between(start: datetime, end: datetime) -> float:
+    """
+    The seconds that pass between two naive local times, which across a daylight
+    saving change differs from the difference in wall clock time
+    """
+    return end.timestamp() - start.timestamp()
+
+
+class CronExpression:
+    """
+    A standard 5 field cron expression (minute hour day-of-month month day-of-week)
+    supporting *, lists, ranges and steps e.g. '*/15 8-18 * * 1-5'. Matches are in
+    wall clock time, a match in the gap when clocks go forward runs an hour later.
+    """
+
+    _FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str) -> None:
+        fields = expression.split()
+        if len(fields) != 5:
+            raise CronError(f"Invalid cron expression: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, lo, hi)
+            for field, (lo, hi) in zip(fields, self._FIELD_RANGES)
+        )
+        # 0 and 7 are both Sunday
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> frozenset[int]:
+        values: set[int] = set()
+        for part in field.split(","):
+            value_range, _, step_str = part.partition("/")
+            try:
+                step = int(step_str) if step_str else 1
+                if value_range == "*":
+                    start, end = lo, hi
+                elif "-" in value_range:
+                    start_str, end_str = value_range.split("-")
+                    start, end = int(start_str), int(end_str)
+                else:
+                    start = int(value_range)
+                    end = hi if step_str else start
+            except ValueError:
+                raise CronError(f"Invalid cron field: '{field}'")
+            if not (lo <= start <= end <= hi) or step < 1:
+                raise CronError(f"Invalid cron field: '{field}'")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _matches_day(self, dt: datetime) -> bool:
+        day_match = dt.day in self.days
+        # Python weekdays start on Monday, cron weekdays start on Sunday
+        weekday_match = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_match and weekday_match
+        # When both are restricted cron matches either
+        return day_match or weekday_match
+
+    def next_after(self, dt: datetime) -> datetime:
+        """Returns the first matching minute after dt"""
+        candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._matches_day(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise CronError(f"Cron expression never matches: '{self.expression}'")
+
+
+class SynchScheduler(threading.Thread):
+    """
+    Periodically synchs the store with clockify in a background thread, either
+    every interval or on a cron schedule, delayed by a random jitter so workers
+    started together don't all synch at once. Runs are skipped (not queued) while
+    another synch holds the synch lock.
+    """
+
+    def __init__(
+        self,
+        store: Store,
+        interval: timedelta | None = None,
+        cron: CronExpression | None = None,
+        jitter: timedelta = timedelta(0),
+    ) -> None:
+        if (interval is None) == (cron is None):
+            raise ValueError("Exactly one of interval or cron is required")
+        super().__init__(name="synch-scheduler", daemon=True)
+        self.store = store
+        self.interval = interval
+        self.cron = cron
+        self.jitter = jitter
+        self._stopped = threading.Event()
+
+    def next_run(self, now: datetime) -> datetime:
+        if self.cron is not None:
+            scheduled = self.cron.next_after(now)
+        else:
+            assert self.interval is not None
+            scheduled = now + self.interval
+        return scheduled + self.jitter * random.random()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        schedule = self.cron.expression if self.cron else f"every {self.interval}"
+        logger.info(f"Scheduled synch with clockify {schedule}")
+        while True:
+            next_run = self.next_run(datetime.now())
+            logger.debug(f"Next scheduled synch at {next_run:%Y-%m-%d %H:%M:%S}")
+            wait = _seconds_between(datetime.now(), next_run)
+            if self._stopped.wait(max(wait, 0)):
+                return
+            try:
+                synch_with_clockify(self.store, blocking=False)
+            except SynchInProgress:
+                logger.info("Skipping scheduled synch, a synch is already running")
+            except Exception:
+                logger.exception("Scheduled synch failed")
+
+
+def scheduler_from_config(store: Store) -> SynchScheduler | None:
+    """
+    Returns a scheduler for the store's synch config or None if scheduled synching
+    is not configured. A cron expression takes precedence over an interval.
+    Raises CronError if the cron expression is invalid or never matches.
+    """
+    config = store.config
+    jitter = timedelta(seconds=config.SYNCH_JITTER_SECONDS)
+    if config.SYNCH_CRON:
+        cron = CronExpression(config.SYNCH_CRON)
+        # Raises CronError now for an expression that never matches (e.g. 31 Feb)
+        # rather than in the scheduler thread after the server has started
+        cron.next_after(datetime.now())
+        return SynchScheduler(store, cron=cron, jitter=jitter)
+    if config.SYNCH_INTERVAL_MINUTES > 0:
+        interval = timedelta(minutes=config.SYNCH_INTERVAL_MINUTES)
+        return SynchScheduler(store, interval=interval, jitter=jitter)
+    return None
@@ -3,11 +3,15 @@ from __future__ import annotations
 import base64
 import contextlib
 import datetime
+import itertools
 import logging
 import os
 import pickle
 import sqlite3
+from collections.abc import Callable
 from collections.abc import Generator
+from collections.abc import Iterable
+from collections.abc import Iterator
 from typing import Any
 
 from clockify_invoice.config import Config
@@ -17,34 +21,397 @@ from clockify_invoice.invoice import TimeEntry
 logger = logging.getLogger("clockify-invoice")
 
 _TIME_ENTRIES_QUERY = """\
-SELECT MAX(end_time) AS date
-    , description
-    , SUM(duration_seconds)
-FROM time_entry
-WHERE user = ?
-    AND workspace = ?
-    AND start_time >= ?
-    AND end_time < ?
-    AND duration_seconds > 0
-GROUP BY description
+SELECT MAX(te.end_time) AS date
+    , d.text
+    , SUM(te.duration_seconds)
+FROM time_entry te
+LEFT JOIN description d ON d.id = te.description_id
+WHERE te.user = ?
+    AND te.workspace = ?
+    AND te.start_time >= ?
+    AND te.end_time < ?
+    AND te.duration_seconds > 0
+GROUP BY te.description_id
 """
 
 _INVOCES_QUERY = """\
-SELECT id, pickle
+SELECT id, pickle, id NOT IN (SELECT id FROM main.invoice)
 FROM invoice
 WHERE period_start > ?
     AND period_end < ?
 """
 
+_INVOICES_TOTAL_QUERY = """\
+SELECT COALESCE(SUM(total), 0)
+FROM invoice
+WHERE period_start > ?
+    AND period_end < ?
+"""
+
+_EXPORT_TIME_ENTRIES_QUERY = """\
+SELECT te.id
+    , te.start_time
+    , te.end_time
+    , te.duration_seconds
+    , d.text
+FROM time_entry te
+LEFT JOIN description d ON d.id = te.description_id
+WHERE te.user = ?
+    AND te.workspace = ?
+    AND (te.start_time, te.id) > (?, ?)
+    AND te.start_time < ?
+ORDER BY te.start_time, te.id
+LIMIT ?
+"""
+
+_EXPORT_INVOICES_QUERY = """\
+SELECT id
+    , number
+    , date
+    , period_start
+    , period_end
+    , payer
+    , payee
+    , total
+    , paid
+FROM invoice
+WHERE (period_start, number, id) > (?, ?, ?)
+    AND period_start < ?
+ORDER BY period_start, number, id
+LIMIT ?
+"""
+
+_INVOICE_IDS_QUERY = """\
+SELECT id
+FROM invoice
+WHERE period_start >= ?
+    AND period_start < ?
+ORDER BY period_start, number
+"""
+
+_INVOICE_PDF_QUERY = """\
+SELECT COALESCE(saved_at, date)
+    , pickle
+    , pdf
+FROM invoice
+WHERE id = ?
+"""
+
+_INSERT_DESCRIPTION_QUERY = """\
+INSERT OR IGNORE INTO description(text) VALUES(?)
+"""
+
+# Takes a time entry row with the description's text, which must already be in
+# the description table
+_UPSERT_TIME_ENTRY_QUERY = """\
+INSERT INTO time_entry
+VALUES(?,?,?,?,(SELECT id FROM description WHERE text = ?),?,?)
+ON CONFLICT(id) DO UPDATE SET
+    start_time = excluded.start_time
+    , end_time = excluded.end_time
+    , duration_seconds = excluded.duration_seconds
+    , description_id = excluded.description_id
+    , user = excluded.user
+    , workspace = excluded.workspace
+"""
+
+_CREATE_TIME_ENTRY_QUERY = """\
+CREATE TABLE IF NOT EXISTS time_entry (
+    id TEXT PRIMARY KEY,
+    start_time TEXT,
+    end_time TEXT,
+    duration_seconds INT,
+    description_id INT,
+    user TEXT,
+    workspace TEXT,
+    FOREIGN KEY (description_id) REFERENCES description(id),
+    FOREIGN KEY (user) REFERENCES user(id),
+    FOREIGN KEY (workspace) REFERENCES workspace(id)
+)
+"""
+
+_TIME_ENTRY_INDEX_QUERIES = (
+    """\
+CREATE INDEX IF NOT EXISTS time_entry_user_workspace_start
+ON time_entry(user, workspace, start_time)
+""",
+    """\
+CREATE INDEX IF NOT EXISTS time_entry_description
+ON time_entry(description_id)
+""",
+)
+
+# CSV exports have no ids so imported CSV entries (with csv- ids, searched as a
+# range of the primary key) can't match synched ones by id; an entry with a
+# clockify id starting and ending in the same minutes with the same description
+# is the same entry
+_DELETE_CSV_DUPLICATES_QUERY = """\
+DELETE
+FROM main.time_entry
+WHERE id > 'csv-'
+    AND id < 'csv.'
+    AND EXISTS (
+        SELECT 1
+        FROM main.time_entry s
+        WHERE s.user = time_entry.user
+            AND s.workspace = time_entry.workspace
+            AND s.start_time BETWEEN substr(time_entry.start_time, 1, 16)
+                AND substr(time_entry.start_time, 1, 16) || ':59'
+            AND substr(s.end_time, 1, 16) = substr(time_entry.end_time, 1, 16)
+            AND s.description_id IS time_entry.description_id
+            AND s.id NOT LIKE 'csv-%'
+    )
+"""
+
+# Synchs stage time entries with their description's text, the descriptions are
+# interned when the staged entries are committed
+_CREATE_STAGED_TIME_ENTRY_QUERY = """\
+CREATE TEMP TABLE time_entry (
+    id TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_seconds INT,
+    description TEXT,
+    user TEXT,
+    workspace TEXT
+)
+"""
+
+_COMMIT_STAGED_DESCRIPTIONS_QUERY = """\
+INSERT OR IGNORE INTO main.description(text)
+SELECT description
+FROM temp.time_entry
+WHERE {not_archived}
+"""
+
+_COMMIT_STAGED_TIME_ENTRIES_QUERY = """\
+INSERT INTO main.time_entry
+SELECT te.id
+    , te.start_time
+    , te.end_time
+    , te.duration_seconds
+    , d.id
+    , te.user
+    , te.workspace
+FROM temp.time_entry te
+LEFT JOIN main.description d ON d.text = te.description
+WHERE {not_archived}
+"""
+
+# Converts a time_entry table from before descriptions were interned. The
+# {dictionary} schema holds the description table that ids are taken from.
+_MIGRATE_DESCRIPTIONS_SCRIPT = """\
+DROP TRIGGER IF EXISTS time_entry_fts_insert;
+DROP TRIGGER IF EXISTS time_entry_fts_delete;
+DROP TRIGGER IF EXISTS time_entry_fts_update;
+DROP TABLE IF EXISTS time_entry_fts;
+
+INSERT OR IGNORE INTO {dictionary}.description(text)
+SELECT description
+FROM time_entry;
+
+ALTER TABLE time_entry RENAME TO time_entry_legacy;
+
+{create_time_entry};
+
+INSERT INTO time_entry
+SELECT te.id
+    , te.start_time
+    , te.end_time
+    , te.duration_seconds
+    , d.id
+    , te.user
+    , te.workspace
+FROM time_entry_legacy te
+LEFT JOIN {dictionary}.description d ON d.text = te.description;
+
+DROP TABLE time_entry_legacy;
+
+INSERT OR IGNORE INTO description
+SELECT *
+FROM {dictionary}.description
+WHERE id IN (SELECT description_id FROM time_entry);
+"""
+
 _DELETE_INVOICE_QUERY = """\
 DELETE
 FROM INVOICE
 WHERE id = ?
 """
 
+_DASHBOARD_MONTHS_QUERY = """\
+WITH hours AS (
+    SELECT strftime('%Y-%m', te.start_time) AS month
+        , SUM(te.duration_seconds) / 3600.0 AS hours
+        , SUM(
+            CASE WHEN EXISTS (
+                SELECT 1
+                FROM invoice i
+                WHERE te.start_time >= i.period_start
+                    AND te.start_time < i.period_end
+            ) THEN 0 ELSE te.duration_seconds END
+        ) / 3600.0 AS unbilled_hours
+    FROM time_entry te
+    WHERE te.user = ?
+        AND te.workspace = ?
+        AND te.start_time >= ?
+        AND te.start_time < ?
+        AND te.duration_seconds > 0
+    GROUP BY month
+), revenue AS (
+    SELECT strftime('%Y-%m', period_start) AS month
+        , SUM(total) AS revenue
+        , COUNT(*) AS invoices
+    FROM invoice
+    WHERE period_start >= ?
+        AND period_start < ?
+    GROUP BY month
+), months AS (
+    SELECT month FROM hours
+    UNION
+    SELECT month FROM revenue
+)
+SELECT m.month
+    , COALESCE(h.hours, 0)
+    , COALESCE(h.unbilled_hours, 0)
+    , COALESCE(r.revenue, 0)
+    , COALESCE(r.invoices, 0)
+    , r.revenue / NULLIF(h.hours - h.unbilled_hours, 0) AS effective_rate
+    , SUM(COALESCE(r.revenue, 0)) OVER (ORDER BY m.month) AS cumulative_revenue
+FROM months m
+LEFT JOIN hours h USING (month)
+LEFT JOIN revenue r USING (month)
+ORDER BY m.month
+"""
+
+_DASHBOARD_DESCRIPTIONS_QUERY = """\
+SELECT d.text
+    , SUM(te.duration_seconds) / 3600.0 AS hours
+    , SUM(te.duration_seconds) * 100.0 / SUM(SUM(te.duration_seconds)) OVER () AS share
+FROM time_entry te
+LEFT JOIN description d ON d.id = te.description_id
+WHERE te.user = ?
+    AND te.workspace = ?
+    AND te.start_time >= ?
+    AND te.start_time < ?
+    AND te.duration_seconds > 0
+GROUP BY te.description_id
+ORDER BY hours DESC
+"""
+
+_PERIOD_SUMMARY_QUERY = """\
+SELECT id
+FROM period_summary
+WHERE period_start = ?
+    AND period_end = ?
+    AND (? OR fetched_at >= period_end OR fetched_at > ?)
+"""
+
+_PERIOD_SUMMARY_ENTRIES_QUERY = """\
+SELECT e.date
+    , d.text
+    , e.duration_seconds
+FROM period_summary_entry e
+LEFT JOIN description d ON d.id = e.description_id
+WHERE e.summary = ?
+"""
+
+_DELETE_PERIOD_SUMMARY_ENTRIES_QUERY = """\
+DELETE
+FROM period_summary_entry
+WHERE summary IN (
+    SELECT id
+    FROM period_summary
+    WHERE period_start = ?
+        AND period_end = ?
+)
+"""
+
+_INSERT_PERIOD_SUMMARY_ENTRY_QUERY = """\
+INSERT INTO period_summary_entry
+VALUES(?,?,(SELECT id FROM description WHERE text = ?),?)
+"""
+
+_RECLAIM_INVOICE_NUMBER_QUERY = """\
+SELECT MIN(number)
+FROM invoice_reservation
+WHERE reserved_at IS NULL
+    OR reserved_at < ?
+"""
+
+# Control characters that can't appear in a description
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+_CLOCKIFY_TABLES = ("workspace", "user", "time_entry")
+# Tables moved to per financial year archive databases
+_ARCHIVED_TABLES = ("time_entry", "invoice")
+
+_NOT_ARCHIVED_CONDITION = """\
+NOT EXISTS (
+    SELECT 1
+    FROM main.archive a
+    WHERE start_time >= a.period_start
+        AND start_time < a.period_end
+)"""
+
+# Each distinct description is indexed once
+_CREATE_SEARCH_INDEX_SCRIPT = """\
+CREATE VIRTUAL TABLE IF NOT EXISTS description_fts USING fts5(
+    text,
+    content='description',
+    content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS description_fts_insert
+AFTER INSERT ON description BEGIN
+    INSERT INTO description_fts(rowid, text)
+    VALUES (new.id, new.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS description_fts_delete
+AFTER DELETE ON description BEGIN
+    INSERT INTO description_fts(description_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS description_fts_update
+AFTER UPDATE OF text ON description BEGIN
+    INSERT INTO description_fts(description_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+    INSERT INTO description_fts(rowid, text)
+    VALUES (new.id, new.text);
+END;
+"""
+
+_SEARCH_QUERY = """\
+SELECT te.id
+    , te.start_time
+    , te.duration_seconds
+    , highlight(description_fts, 0, ?, ?)
+    , i.id
+    , i.number
+FROM {schema}.description_fts
+JOIN {schema}.time_entry te ON te.description_id = description_fts.rowid
+LEFT JOIN invoice i ON i.id = (
+    SELECT id
+    FROM invoice
+    WHERE te.start_time >= period_start
+        AND te.start_time < period_end
+    ORDER BY number
+    LIMIT 1
+)
+WHERE description_fts MATCH ?
+    AND te.user = ?
+    AND te.workspace = ?
+ORDER BY te.start_time DESC, te.id DESC
+LIMIT ?
+"""
+
 _SAMPLE_CONFIG = """\
 {
     "api_key": "",
+    "data_source": "synch",
     "flask": {
         "host": "0.0.0.0",
         "port": 5000,
@@ -52,6 +419,19 @@ _SAMPLE_CONFIG = """\
         "password": ""
 
     },
+    "webhook": {
+        "secret": ""
+    },
+    "synch": {
+        "interval_minutes": 0,
+        "cron": "",
+        "jitter_seconds": 30
+    },
+    "pdf": {
+        "optimize_size": ["fonts", "images"],
+        "variant": "",
+        "version": ""
+    },
     "mail": {
         "server": "smtp.gmail.com",
         "port": 465,
@@ -75,8 +455,37 @@ _SAMPLE_CONFIG = """\
 """
 
 
+def _split_script(script: str) -> list[str]:
+    """Splits a SQL script into statements so they can run inside a transaction"""
+    statements: list[str] = []
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ""
+    return statements
+
+
+class InvoiceNumberError(Exception):
+    pass
+
+
+class SearchError(Exception):
+    pass
+
+
+class ArchiveError(Exception):
+    pass
+
+
 class Store:
     _DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    # Reserved invoice numbers that have not been saved within this time are
+    # reclaimed by the next reservation
+    _RESERVATION_TTL = datetime.timedelta(days=1)
+    # Summaries of periods that had not ended when fetched are refetched after this
+    _SUMMARY_MAX_AGE = datetime.timedelta(minutes=10)
 
     def __init__(self, config_file: str | None = None) -> None:
         self.directory = self._get_default_directory()
@@ -85,9 +494,13 @@ class Store:
         )
         self._initialise(config_file)
         self.db_path = os.path.join(self.directory, "db.db")
+        self.http_cache_directory = os.path.join(self.directory, "http-cache")
+        self.archive_directory = os.path.join(self.directory, "archive")
+        self.profile_directory = os.path.join(self.directory, "profiles")
         self.config = Config(config_file)
         self._workspace_id = None
         self._user_id = None
+        self._dashboard_cache: dict[tuple[int, int], dict[str, Any]] = {}
         self._create_db_if_not_exists()
 
     def _initialise(self, config_file: str) -> None:
@@ -112,6 +525,7 @@ class Store:
         )
 
     def _create_db_if_not_exists(self, db_path: str | None = None) -> None:
+        archives: list[tuple[str]] = []
         with self.connect(db_path) as db:
             db.executescript(
                 """\
@@ -131,16 +545,9 @@ class Store:
                     FOREIGN KEY (active_workspace) REFERENCES workspace(id)
                 );
 
-                CREATE TABLE IF NOT EXISTS time_entry (
-                    id TEXT PRIMARY KEY,
-                    start_time TEXT,
-                    end_time TEXT,
-                    duration_seconds INT,
-                    description TEXT,
-                    user TEXT,
-                    workspace TEXT,
-                    FOREIGN KEY (user) REFERENCES user(id),
-                    FOREIGN KEY (workspace) REFERENCES workspace(id)
+                CREATE TABLE IF NOT EXISTS description (
+                    id INTEGER PRIMARY KEY,
+                    text TEXT NOT NULL UNIQUE
                 );
 
                 CREATE TABLE IF NOT EXISTS invoice (
@@ -154,10 +561,133 @@ class Store:
                     total REAL,
                     paid INT,
                     pdf TEXT,
-                    pickle TEXT
+                    pickle TEXT,
+                    saved_at TEXT
                 );
+
+                CREATE INDEX IF NOT EXISTS invoice_period
+                ON invoice(period_start, period_end);
+
+                CREATE TABLE IF NOT EXISTS db_generation (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    generation INT NOT NULL
+                );
+
+                INSERT OR IGNORE INTO db_generation VALUES (1, 0);
+
+                CREATE TABLE IF NOT EXISTS invoice_sequence (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    next_number INT NOT NULL
+                );
+
+                INSERT OR IGNORE INTO invoice_sequence
+                SELECT 1, COALESCE(MAX(number), 0) + 1 FROM invoice;
+
+                CREATE TABLE IF NOT EXISTS invoice_reservation (
+                    number INTEGER PRIMARY KEY,
+                    reserved_at TEXT
+                );
+
+                CREATE TABLE IF NOT EXISTS archive (
+                    financial_year INTEGER PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    period_start TEXT NOT NULL,
+                    period_end TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS period_summary (
+                    id INTEGER PRIMARY KEY,
+                    period_start TEXT NOT NULL,
+                    period_end TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    UNIQUE (period_start, period_end)
+                );
+
+                CREATE TABLE IF NOT EXISTS period_summary_entry (
+                    summary INT NOT NULL,
+                    date TEXT,
+                    description_id INT,
+                    duration_seconds INT,
+                    FOREIGN KEY (summary) REFERENCES period_summary(id),
+                    FOREIGN KEY (description_id) REFERENCES description(id)
+                );
+
+                CREATE INDEX IF NOT EXISTS period_summary_entry_summary
+                ON period_summary_entry(summary);
                 """
             )
+            columns = [row[1] for row in db.execute("PRAGMA table_info(invoice)")]
+            if "saved_at" not in columns:
+                # Invoices saved before this have their date as their save time
+                db.execute("ALTER TABLE invoice ADD COLUMN saved_at TEXT")
+            db.execute(_CREATE_TIME_ENTRY_QUERY)
+            self._migrate_descriptions(db, db_path)
+            for query in _TIME_ENTRY_INDEX_QUERIES:
+                db.execute(query)
+            try:
+                db.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS invoice_number "
+                    "ON invoice(number)"
+                )
+            except sqlite3.IntegrityError:
+                logger.warning(
+                    "Unable to enforce unique invoice numbers as the db already "
+                    "contains duplicates. Delete the duplicate invoices to fix this."
+                )
+            self._create_search_index(db)
+            if db_path is None:
+                archives = db.execute("SELECT file_name FROM archive").fetchall()
+        if db_path is None:
+            # Keep the archives' schema in step with the main db
+            for (file_name,) in archives:
+                path = os.path.join(self.archive_directory, file_name)
+                if os.path.exists(path):
+                    self._create_db_if_not_exists(path)
+
+    def _migrate_descriptions(
+        self, db: sqlite3.Connection, db_path: str | None = None
+    ) -> None:
+        """
+        Moves time entry descriptions from a time_entry text column into the
+        description table, referencing them by id. Archives use the main db's ids
+        (and keep a copy of the descriptions they use) so entries read through
+        connect_period all join to the main db's description table.
+        """
+        columns = [row[1] for row in db.execute("PRAGMA table_info(time_entry)")]
+        if "description" not in columns:
+            return
+        dictionary = "main"
+        if db_path is not None:
+            db.execute("ATTACH DATABASE ? AS main_db", (self.db_path,))
+            dictionary = "main_db"
+        logger.info(f"Migrating time entry descriptions in {db_path or self.db_path}")
+        script = _MIGRATE_DESCRIPTIONS_SCRIPT.format(
+            dictionary=dictionary,
+            create_time_entry=_CREATE_TIME_ENTRY_QUERY.strip(),
+        )
+        db.execute("BEGIN IMMEDIATE")
+        for statement in _split_script(script):
+            db.execute(statement)
+        self.bump_generation(db)
+        db.commit()
+        if db_path is not None:
+            db.execute("DETACH DATABASE main_db")
+
+    def _create_search_index(self, db: sqlite3.Connection) -> None:
+        """
+        Creates the full-text index over descriptions, kept in sync by triggers,
+        building it from the existing descriptions if it is new.
+        """
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'description_fts'"
+        ).fetchone()
+        try:
+            db.executescript(_CREATE_SEARCH_INDEX_SCRIPT)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search is unavailable: {e}")
+            return
+        if not exists:
+            db.execute("INSERT INTO description_fts(description_fts) VALUES('rebuild')")
 
     @contextlib.contextmanager
     def connect(
@@ -168,15 +698,187 @@ class Store:
             with db:
                 yield db
 
+    @contextlib.contextmanager
+    def connect_period(
+        self,
+        start: datetime.date | None = None,
+        end: datetime.date | None = None,
+    ) -> Generator[sqlite3.Connection, None, None]:
+        """
+        Connects to the db with the archives overlapping the period attached (all
+        archives if no period is given). In the connection time_entry and invoice
+        are temp views over the main tables and the attached archives, so queries
+        see archived rows transparently. The views are read only. SQLite can only
+        attach 10 dbs so wider periods must be split (see _period_segments).
+        """
+        with self.connect() as db:
+            schemas = []
+            for financial_year, file_name in db.execute(
+                "SELECT financial_year, file_name FROM archive "
+                "WHERE (? IS NULL OR period_end > ?) "
+                "AND (? IS NULL OR period_start < ?) "
+                "ORDER BY financial_year",
+                (start, start, end, end),
+            ).fetchall():
+                schema = f"fy{int(financial_year)}"
+                path = os.path.join(self.archive_directory, file_name)
+                db.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+                schemas.append(schema)
+            if schemas:
+                for table in _ARCHIVED_TABLES:
+                    union = " UNION ALL ".join(
+                        f"SELECT * FROM {schema}.{table}"
+                        for schema in ["main", *schemas]
+                    )
+                    db.execute(f"CREATE TEMP VIEW {table} AS {union}")
+            yield db
+
+    def _archives(self) -> list[tuple[str, datetime.date, datetime.date]]:
+        """
+        Returns the schema connect_period attaches each archive as and the period it
+        covers. SQLite can only attach 10 dbs to a connection so queries that may
+        need any archive go through them one at a time.
+        """
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT financial_year, period_start, period_end FROM archive "
+                "ORDER BY financial_year"
+            ).fetchall()
+        return [
+            (
+                f"fy{int(financial_year)}",
+                datetime.date.fromisoformat(period_start),
+                datetime.date.fromisoformat(period_end),
+            )
+            for financial_year, period_start, period_end in rows
+        ]
+
+    def _invoice_archive(
+        self, invoice_id: int
+    ) -> tuple[str, datetime.date, datetime.date] | None:
+        """Returns the archive (as _archives) holding the invoice or None"""
+        return self._find_invoice_archive("id", invoice_id)
+
+    def _invoice_number_archive(
+        self, number: int
+    ) -> tuple[str, datetime.date, datetime.date] | None:
+        """Returns the archive (as _archives) holding the invoice number or None"""
+        return self._find_invoice_archive("number", number)
+
+    def _find_invoice_archive(
+        self, column: str, value: int
+    ) -> tuple[str, datetime.date, datetime.date] | None:
+        for archive in self._archives():
+            schema, period_start, period_end = archive
+            with self.connect_period(period_start, period_end) as db:
+                cur = db.execute(
+                    f"SELECT 1 FROM {schema}.invoice WHERE {column} = ?", (value,)
+                )
+                if cur.fetchone() is not None:
+                    return archive
+        return None
+
+    def archive_financial_year(self, financial_year: int) -> int:
+        """
+        Moves the time entries and invoices of a closed financial year out of the
+        main db into an archive db under archive_directory, then vacuums the main
+        db. Returns the number of rows moved.
+        """
+        period_start = datetime.date(financial_year, 7, 1)
+        period_end = datetime.date(financial_year + 1, 7, 1)
+        if period_end > datetime.date.today():
+            raise ArchiveError(f"Financial year {financial_year} has not closed yet")
+
+        file_name = f"fy{financial_year}.db"
+        os.makedirs(self.archive_directory, exist_ok=True)
+        archive_path = os.path.join(self.archive_directory, file_name)
+        self._create_db_if_not_exists(archive_path)
+
+        moved = 0
+        with self.connect() as db:
+            cur = db.execute(
+                "SELECT 1 FROM archive WHERE financial_year = ?", (financial_year,)
+            )
+            if cur.fetchone() is not None:
+                raise ArchiveError(f"Financial year {financial_year} is archived")
+            db.execute("ATTACH DATABASE ? AS archive_db", (archive_path,))
+            db.execute("BEGIN IMMEDIATE")
+            # Needed by queries filtering on user/workspace
+            for table in ("workspace", "user"):
+                db.execute(
+                    f"INSERT OR REPLACE INTO archive_db.{table} SELECT * FROM {table}"
+                )
+            for table, column in (
+                ("time_entry", "start_time"),
+                ("invoice", "period_start"),
+            ):
+                condition = f"{column} >= ? AND {column} < ?"
+                cur = db.execute(
+                    f"INSERT INTO archive_db.{table} "
+                    f"SELECT * FROM main.{table} WHERE {condition}",
+                    (period_start, period_end),
+                )
+                moved += cur.rowcount
+                db.execute(
+                    f"DELETE FROM main.{table} WHERE {condition}",
+                    (period_start, period_end),
+                )
+            # Descriptions keep their main db ids so the archive is self contained
+            db.execute(
+                "INSERT OR IGNORE INTO archive_db.description "
+                "SELECT * FROM main.description "
+                "WHERE id IN (SELECT description_id FROM archive_db.time_entry)"
+            )
+            db.execute(
+                "INSERT INTO archive VALUES(?,?,?,?)",
+                (financial_year, file_name, period_start, period_end),
+            )
+            self.bump_generation(db)
+            db.commit()
+            db.execute("DETACH DATABASE archive_db")
+            db.execute("VACUUM")
+        logger.info(f"Archived {moved} rows from {financial_year} to {archive_path}")
+        return moved
+
+    def get_generation(self) -> int:
+        """
+        Returns the db generation. This is incremented whenever the time entries or
+        invoices change so it can be used to key anything derived from them.
+        """
+        with self.connect() as db:
+            return int(db.execute("SELECT generation FROM db_generation").fetchone()[0])
+
+    def bump_generation(self, db: sqlite3.Connection) -> None:
+        db.execute("UPDATE db_generation SET generation = generation + 1")
+
     def delete_invoice(self, id: int) -> None:
+        """
+        Deletes a saved invoice. Archives are read only so raises ArchiveError if
+        the invoice is archived.
+        """
         with self.connect() as db:
+            row = db.execute(
+                "SELECT number FROM invoice WHERE id = ?", (id,)
+            ).fetchone()
+            if row is None:
+                if self._invoice_archive(id) is not None:
+                    raise ArchiveError(f"Invoice [{id}] is archived")
+                logger.warning(f"Invoice [{id}] does not exist")
+                return
             db.execute(_DELETE_INVOICE_QUERY, (id,))
+            if row[0] is not None:
+                # As with MAX(number) + 1 deleting the latest invoice frees its number
+                db.execute(
+                    "UPDATE invoice_sequence SET next_number = ? WHERE next_number = ?",
+                    (row[0], row[0] + 1),
+                )
+            self.bump_generation(db)
         logger.info(f"Deleted invoice [{id}]")
 
     def get_time_entries(
         self, start: datetime.date, end: datetime.date
     ) -> list[TimeEntry]:
-        with self.connect() as db:
+        with self.connect_period(start, end) as db:
             rows = db.execute(
                 _TIME_ENTRIES_QUERY,
                 (
@@ -186,7 +888,13 @@ class Store:
                     end,
                 ),
             ).fetchall()
+        return self._to_time_entries(rows)
 
+    def _to_time_entries(self, rows: Iterable[tuple[Any, ...]]) -> list[TimeEntry]:
+        """
+        Converts rows of date, description and total seconds to invoice time
+        entries, rounded to the quarter hour
+        """
         entries: list[TimeEntry] = []
         for row in rows:
             date = datetime.datetime.strptime(row[0], self._DATE_FORMAT)
@@ -199,7 +907,63 @@ class Store:
             entries.append(time_entry)
         return entries
 
+    def get_period_summary(
+        self, start: datetime.date, end: datetime.date, allow_stale: bool = False
+    ) -> list[TimeEntry] | None:
+        """
+        Returns the time entries of the period's cached summary, or None if there
+        is none. A summary fetched before the period ended is stale after
+        _SUMMARY_MAX_AGE and is only returned if allow_stale is set.
+        """
+        expired = datetime.datetime.now() - self._SUMMARY_MAX_AGE
+        with self.connect() as db:
+            row = db.execute(
+                _PERIOD_SUMMARY_QUERY,
+                (start, end, allow_stale, expired.strftime(self._DATE_FORMAT)),
+            ).fetchone()
+            if row is None:
+                return None
+            rows = db.execute(_PERIOD_SUMMARY_ENTRIES_QUERY, (row[0],)).fetchall()
+        return self._to_time_entries(rows)
+
+    def save_period_summary(
+        self,
+        start: datetime.date,
+        end: datetime.date,
+        rows: list[tuple[str, str, float]],
+    ) -> list[TimeEntry]:
+        """
+        Caches the period's summary, rows of date (in _DATE_FORMAT), description
+        and total seconds, replacing any previous summary of the period.
+        Returns the summary's time entries.
+        """
+        fetched_at = datetime.datetime.now().strftime(self._DATE_FORMAT)
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(_DELETE_PERIOD_SUMMARY_ENTRIES_QUERY, (start, end))
+            db.execute(
+                "DELETE FROM period_summary WHERE period_start = ? AND period_end = ?",
+                (start, end),
+            )
+            cur = db.execute(
+                "INSERT INTO period_summary(period_start, period_end, fetched_at) "
+                "VALUES(?,?,?)",
+                (start, end, fetched_at),
+            )
+            summary_id = cur.lastrowid
+            db.executemany(_INSERT_DESCRIPTION_QUERY, {(row[1],) for row in rows})
+            db.executemany(
+                _INSERT_PERIOD_SUMMARY_ENTRY_QUERY,
+                [(summary_id, *row) for row in rows],
+            )
+            self.bump_generation(db)
+        return self._to_time_entries(rows)
+
     def save_invoice(self, invoice: Invoice) -> None:
+        """
+        Saves the invoice and consumes its number's reservation.
+        Raises InvoiceNumberError if the number is already used by a saved invoice.
+        """
         invoice_data = (
             invoice.invoice_number,
             invoice.invoice_date,
@@ -209,10 +973,26 @@ class Store:
             invoice.client.name,
             invoice.total,
             0,
-            base64.b64encode(invoice.pdf()).decode(),
+            base64.b64encode(invoice.pdf(self.config.PDF_OPTIONS)).decode(),
             base64.b64encode(pickle.dumps(invoice)).decode(),
+            datetime.datetime.now().strftime(self._DATE_FORMAT),
         )
+        # The UNIQUE index only covers the main db. Archives are read only so their
+        # numbers are checked before taking the lock.
+        if self._invoice_number_archive(invoice.invoice_number) is not None:
+            raise InvoiceNumberError(
+                f"Invoice number {invoice.invoice_number} is already in use"
+            )
         with self.connect() as db:
+            # Take the write lock up front so the check and insert are atomic
+            db.execute("BEGIN IMMEDIATE")
+            cur = db.execute(
+                "SELECT 1 FROM invoice WHERE number = ?", (invoice.invoice_number,)
+            )
+            if cur.fetchone() is not None:
+                raise InvoiceNumberError(
+                    f"Invoice number {invoice.invoice_number} is already in use"
+                )
             cols = (
                 "number",
                 "date",
@@ -224,16 +1004,27 @@ class Store:
                 "paid",
                 "pdf",
                 "pickle",
+                "saved_at",
             )
             db.execute(
-                f"INSERT INTO invoice({','.join(cols)}) VALUES(?,?,?,?,?,?,?,?,?,?)",
+                f"INSERT INTO invoice({','.join(cols)}) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
                 invoice_data,
             )
+            db.execute(
+                "DELETE FROM invoice_reservation WHERE number = ?",
+                (invoice.invoice_number,),
+            )
+            # A manually entered number may be ahead of the sequence
+            db.execute(
+                "UPDATE invoice_sequence SET next_number = MAX(next_number, ?)",
+                (invoice.invoice_number + 1,),
+            )
+            self.bump_generation(db)
 
     def get_invoices(self, financial_year: int) -> list[dict[str, Any]]:
         start_date = datetime.datetime(financial_year, 6, 30)
         end_date = datetime.datetime(financial_year + 1, 7, 1)
-        with self.connect() as db:
+        with self.connect_period(start_date, end_date) as db:
             rows = db.execute(_INVOCES_QUERY, (start_date, end_date)).fetchall()
 
         invoices: list[dict[str, Any]] = []
@@ -243,24 +1034,468 @@ class Store:
             pickle_bytes = base64.b64decode(row[1])
             invoice: Invoice = pickle.loads(pickle_bytes)
             invoice_dict = invoice.to_dict()
-            invoice_dict.update({"invoice_id": invoice_id})
+            invoice_dict.update({"invoice_id": invoice_id, "archived": bool(row[2])})
             invoices.append(invoice_dict)
         return invoices
 
+    def get_invoices_total(self, financial_year: int) -> float:
+        """Returns the total of the invoices get_invoices returns"""
+        start_date = datetime.datetime(financial_year, 6, 30)
+        end_date = datetime.datetime(financial_year + 1, 7, 1)
+        with self.connect_period(start_date, end_date) as db:
+            row = db.execute(_INVOICES_TOTAL_QUERY, (start_date, end_date)).fetchone()
+        return float(row[0])
+
+    def _period_segments(
+        self, start: datetime.date, end: datetime.date
+    ) -> list[tuple[datetime.date, datetime.date]]:
+        """
+        Splits the period at the archive boundaries within it so connect_period
+        attaches at most one archive for each part
+        """
+        bounds = {start, end}
+        with self.connect() as db:
+            for row in db.execute(
+                "SELECT period_start, period_end FROM archive "
+                "WHERE period_end > ? AND period_start < ?",
+                (start, end),
+            ).fetchall():
+                for bound in map(datetime.date.fromisoformat, row):
+                    if start < bound < end:
+                        bounds.add(bound)
+        ordered = sorted(bounds)
+        return list(zip(ordered, ordered[1:]))
+
+    def _iter_query(
+        self,
+        query: str,
+        parameters: tuple[Any, ...],
+        first_key: Callable[[datetime.date], tuple[Any, ...]],
+        key: Callable[[tuple[Any, ...]], tuple[Any, ...]],
+        batch_size: int,
+        start: datetime.date,
+        end: datetime.date,
+    ) -> Iterator[tuple[Any, ...]]:
+        """
+        Lazily yields the rows of a keyset paginated query over the period. The
+        query takes the parameters, the key to continue after, the end of the
+        period and the batch size. Each batch is read in its own connection so a
+        slow consumer (e.g. a client downloading an export) never holds a read
+        transaction open, which would block writers. first_key gives the key
+        before every row starting on a date and key gives the key of a row.
+        """
+        for segment_start, segment_end in self._period_segments(start, end):
+            last_key = first_key(segment_start)
+            while True:
+                with self.connect_period(segment_start, segment_end) as db:
+                    rows = db.execute(
+                        query, (*parameters, *last_key, segment_end, batch_size)
+                    ).fetchall()
+                yield from rows
+                if len(rows) < batch_size:
+                    break
+                last_key = key(rows[-1])
+
+    def iter_time_entries(
+        self, start: datetime.date, end: datetime.date, batch_size: int = 1000
+    ) -> Iterator[tuple[Any, ...]]:
+        """
+        Yields the raw time entries starting in the period (start inclusive, end
+        exclusive) as rows of export.TIME_ENTRY_FIELDS
+        """
+        return self._iter_query(
+            _EXPORT_TIME_ENTRIES_QUERY,
+            (self.get_user_id(), self.get_workspace_id()),
+            # Ids are never empty and any time on the date sorts after the date
+            lambda date: (date, ""),
+            lambda row: (row[1], row[0]),
+            batch_size,
+            start,
+            end,
+        )
+
+    def iter_invoice_summaries(
+        self, start: datetime.date, end: datetime.date, batch_size: int = 1000
+    ) -> Iterator[tuple[Any, ...]]:
+        """
+        Yields the saved invoices with a period starting within start (inclusive)
+        and end (exclusive) as rows of export.INVOICE_FIELDS
+        """
+        return self._iter_query(
+            _EXPORT_INVOICES_QUERY,
+            (),
+            # Invoice numbers and ids start from 1
+            lambda date: (date, 0, 0),
+            lambda row: (row[3], row[1], row[0]),
+            batch_size,
+            start,
+            end,
+        )
+
+    def iter_invoice_pdfs(
+        self, financial_year: int
+    ) -> Iterator[tuple[int, Invoice, bytes]]:
+        """
+        Yields the id, invoice and stored pdf of each saved invoice in the financial
+        year, one row at a time. Each pdf is read in its own connection so no read
+        transaction is held open while the consumer writes it out.
+        """
+        start_date = datetime.date(financial_year, 7, 1)
+        end_date = datetime.date(financial_year + 1, 7, 1)
+        with self.connect_period(start_date, end_date) as db:
+            invoice_ids = [
+                int(row[0])
+                for row in db.execute(_INVOICE_IDS_QUERY, (start_date, end_date))
+            ]
+        for invoice_id in invoice_ids:
+            with self.connect_period(start_date, end_date) as db:
+                row = db.execute(_INVOICE_PDF_QUERY, (invoice_id,)).fetchone()
+            if row is None:
+                # Deleted since the ids were read
+                continue
+            _, pickle_str, pdf_str = row
+            invoice: Invoice = pickle.loads(base64.b64decode(pickle_str))
+            yield invoice_id, invoice, base64.b64decode(pdf_str)
+
+    def get_invoice_pdf(
+        self, invoice_id: int
+    ) -> tuple[Invoice, datetime.datetime, bytes] | None:
+        """
+        Returns the saved invoice, when it was saved (in local time) and its stored
+        pdf or None if there is no invoice with the id
+        """
+        with self.connect() as db:
+            row = db.execute(_INVOICE_PDF_QUERY, (invoice_id,)).fetchone()
+        if row is None and (archive := self._invoice_archive(invoice_id)):
+            _, period_start, period_end = archive
+            with self.connect_period(period_start, period_end) as db:
+                row = db.execute(_INVOICE_PDF_QUERY, (invoice_id,)).fetchone()
+        if row is None:
+            return None
+        saved_at, pickle_str, pdf_str = row
+        invoice: Invoice = pickle.loads(base64.b64decode(pickle_str))
+        return (
+            invoice,
+            datetime.datetime.fromisoformat(saved_at).astimezone(),
+            base64.b64decode(pdf_str),
+        )
+
     def get_next_invoice_number(self) -> int:
+        """
+        Returns the next number in the invoice sequence without reserving it.
+        Use reserve_invoice_number for a number that will be saved.
+        """
         with self.connect() as db:
-            cur = db.execute("SELECT MAX(number) FROM invoice")
-            result = cur.fetchone()[0] or 0
-        return int(result) + 1
+            cur = db.execute("SELECT next_number FROM invoice_sequence")
+            result = cur.fetchone()[0]
+        return int(result)
+
+    def reserve_invoice_number(self) -> int:
+        """
+        Atomically reserves an invoice number so concurrent sessions or workers are
+        never handed the same one. Released numbers and reservations older than
+        _RESERVATION_TTL are reused (lowest first) before the sequence advances.
+        """
+        now = datetime.datetime.now()
+        reserved_at = now.strftime(self._DATE_FORMAT)
+        expired = (now - self._RESERVATION_TTL).strftime(self._DATE_FORMAT)
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            number = db.execute(_RECLAIM_INVOICE_NUMBER_QUERY, (expired,)).fetchone()[0]
+            if number is None:
+                number = db.execute(
+                    "SELECT next_number FROM invoice_sequence"
+                ).fetchone()[0]
+                db.execute("UPDATE invoice_sequence SET next_number = next_number + 1")
+            db.execute(
+                "INSERT OR REPLACE INTO invoice_reservation VALUES(?, ?)",
+                (number, reserved_at),
+            )
+        logger.debug(f"Reserved invoice number {number}")
+        return int(number)
+
+    def release_invoice_number(self, number: int) -> None:
+        """Releases an unsaved reservation so the number can be reused"""
+        with self.connect() as db:
+            db.execute(
+                "UPDATE invoice_reservation SET reserved_at = NULL WHERE number = ?",
+                (number,),
+            )
+
+    def upsert_time_entry(self, row: tuple[Any, ...]) -> bool:
+        """
+        Inserts or updates a time entry row, (id, start_time, end_time,
+        duration_seconds, description, user, workspace), interning the description.
+        Returns False if the entry is in an archived financial year.
+        """
+        with self.connect() as db:
+            cur = db.execute(
+                f"SELECT {_NOT_ARCHIVED_CONDITION} FROM (SELECT ? AS start_time)",
+                (row[1],),
+            )
+            if not cur.fetchone()[0]:
+                logger.warning(f"Time entry [{row[0]}] is in an archived year")
+                return False
+            db.execute(_INSERT_DESCRIPTION_QUERY, (row[4],))
+            db.execute(_UPSERT_TIME_ENTRY_QUERY, row)
+            self.bump_generation(db)
+        return True
+
+    def import_time_entries(
+        self, rows: Iterable[tuple[Any, ...]], batch_size: int = 50_000
+    ) -> int:
+        """
+        Bulk loads time entry rows (as upsert_time_entry), replacing any existing
+        entries with the same id. Everything is loaded in a single transaction with
+        the time entry indexes dropped, then the indexes are rebuilt once.
+        Rows in archived financial years are skipped. CSV entries duplicating an
+        entry with a clockify id are removed. Returns the rows loaded.
+        """
+        loaded = 0
+        with self.connect() as db:
+            archived = db.execute("SELECT period_start, period_end FROM archive")
+            archived_periods = [(str(s), str(e)) for s, e in archived.fetchall()]
+
+            def _not_archived(row: tuple[Any, ...]) -> bool:
+                return not any(s <= row[1] < e for s, e in archived_periods)
+
+            # synchronous stays on: the load is one transaction so only syncs a
+            # few times, and without it an OS crash could corrupt the db
+            db.execute("PRAGMA cache_size = -65536")
+            db.execute("PRAGMA temp_store = MEMORY")
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DROP INDEX IF EXISTS time_entry_user_workspace_start")
+            db.execute("DROP INDEX IF EXISTS time_entry_description")
+
+            rows = filter(_not_archived, rows)
+            while batch := list(itertools.islice(rows, batch_size)):
+                # Only new descriptions reach the table (and the search index)
+                descriptions = {(row[4],) for row in batch}
+                db.executemany(_INSERT_DESCRIPTION_QUERY, descriptions)
+                db.executemany(_UPSERT_TIME_ENTRY_QUERY, batch)
+                loaded += len(batch)
+                logger.debug(f"Loaded {loaded} time entries")
+
+            for query in _TIME_ENTRY_INDEX_QUERIES:
+                db.execute(query)
+            duplicates = db.execute(_DELETE_CSV_DUPLICATES_QUERY).rowcount
+            if duplicates:
+                logger.warning(
+                    f"Removed {duplicates} CSV entries already synched from clockify"
+                )
+            self.bump_generation(db)
+        return loaded
+
+    def get_or_create_import_user(self) -> tuple[str, str, str | None]:
+        """
+        Returns the user id, workspace id and email that imported time entries
+        belong to. If the db has never been synched a placeholder user and
+        workspace are created so imports work offline.
+        """
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT id, COALESCE(active_workspace, default_workspace), email "
+                "FROM user"
+            ).fetchone()
+            if row is None:
+                db.execute("INSERT INTO workspace VALUES(?,?)", ("offline", "Offline"))
+                row = ("offline", "offline", None)
+                db.execute(
+                    "INSERT INTO user VALUES(?,?,?,?,?,?)",
+                    (row[0], self.config.COMPANY.name, None, row[1], row[1], None),
+                )
+        return row[0], row[1], row[2]
+
+    def delete_time_entry(self, entry_id: str) -> bool:
+        """
+        Deletes a time entry. Returns False if it isn't in the main db, e.g.
+        because it is in an archived financial year.
+        """
+        with self.connect() as db:
+            cur = db.execute("DELETE FROM time_entry WHERE id = ?", (entry_id,))
+            if not cur.rowcount:
+                return False
+            self.bump_generation(db)
+        return True
 
     def clear_clockify_tables(self) -> None:
         """
-        Delete all data in time_entry, user, and workspace
+        Delete all data in time_entry, user, and workspace. Descriptions are kept,
+        as archives share their ids.
         """
         with self.connect() as db:
             db.execute("DELETE FROM time_entry")
             db.execute("DELETE FROM user")
             db.execute("DELETE FROM workspace")
+            self.bump_generation(db)
+
+    def stage_clockify_tables(self, db: sqlite3.Connection) -> None:
+        """
+        Shadows time_entry, user and workspace with empty temp tables of the same
+        name for this connection only. Writes to them don't lock the db, and other
+        connections keep seeing the current data until commit_clockify_tables.
+        The staged time_entry takes rows as upsert_time_entry.
+        """
+        for table in _CLOCKIFY_TABLES:
+            if table == "time_entry":
+                db.execute(_CREATE_STAGED_TIME_ENTRY_QUERY)
+            else:
+                db.execute(
+                    f"CREATE TEMP TABLE {table} AS SELECT * FROM main.{table} WHERE 0"
+                )
+
+    def commit_clockify_tables(self, db: sqlite3.Connection) -> None:
+        """
+        Replaces the data in time_entry, user and workspace with the staged data in
+        the connection's current transaction. Imported CSV entries are kept unless
+        they duplicate a synched entry.
+        """
+        for table in _CLOCKIFY_TABLES:
+            if table == "time_entry":
+                db.execute(
+                    "DELETE FROM main.time_entry "
+                    "WHERE NOT (id > 'csv-' AND id < 'csv.')"
+                )
+                # Archived years are kept out of the main db
+                for query in (
+                    _COMMIT_STAGED_DESCRIPTIONS_QUERY,
+                    _COMMIT_STAGED_TIME_ENTRIES_QUERY,
+                ):
+                    db.execute(query.format(not_archived=_NOT_ARCHIVED_CONDITION))
+                duplicates = db.execute(_DELETE_CSV_DUPLICATES_QUERY).rowcount
+                if duplicates:
+                    logger.info(
+                        f"Removed {duplicates} CSV entries synched from clockify"
+                    )
+            else:
+                db.execute(f"DELETE FROM main.{table}")
+                db.execute(f"INSERT INTO main.{table} SELECT * FROM temp.{table}")
+        self.bump_generation(db)
+        db.commit()
+        for table in _CLOCKIFY_TABLES:
+            db.execute(f"DROP TABLE temp.{table}")
+
+    def get_dashboard(self, financial_year: int) -> dict[str, Any]:
+        """
+        Returns revenue, hours, effective hourly rate and unbilled hours for the
+        financial year. The aggregates are computed in SQL and cached until the db
+        generation changes.
+        """
+        generation = self.get_generation()
+        key = (financial_year, generation)
+        if key in self._dashboard_cache:
+            return self._dashboard_cache[key]
+
+        start_date = datetime.date(financial_year, 7, 1)
+        end_date = datetime.date(financial_year + 1, 7, 1)
+        user_workspace = (self.get_user_id(), self.get_workspace_id())
+        with self.connect_period(start_date, end_date) as db:
+            month_rows = db.execute(
+                _DASHBOARD_MONTHS_QUERY,
+                (*user_workspace, start_date, end_date, start_date, end_date),
+            ).fetchall()
+            description_rows = db.execute(
+                _DASHBOARD_DESCRIPTIONS_QUERY,
+                (*user_workspace, start_date, end_date),
+            ).fetchall()
+
+        months = [
+            {
+                "month": datetime.datetime.strptime(row[0], "%Y-%m"),
+                "hours": row[1],
+                "unbilled_hours": row[2],
+                "revenue": row[3],
+                "invoices": row[4],
+                "effective_rate": row[5],
+                "cumulative_revenue": row[6],
+            }
+            for row in month_rows
+        ]
+        descriptions = [
+            {"description": row[0], "hours": row[1], "share": row[2]}
+            for row in description_rows
+        ]
+        hours = sum(month["hours"] for month in months)
+        unbilled_hours = sum(month["unbilled_hours"] for month in months)
+        revenue = sum(month["revenue"] for month in months)
+        billed_hours = hours - unbilled_hours
+        dashboard = {
+            "months": months,
+            "descriptions": descriptions,
+            "hours": hours,
+            "unbilled_hours": unbilled_hours,
+            "revenue": revenue,
+            "effective_rate": revenue / billed_hours if billed_hours else None,
+        }
+        # Only the current generation is worth keeping
+        self._dashboard_cache = {
+            k: v for k, v in self._dashboard_cache.items() if k[1] == generation
+        }
+        self._dashboard_cache[key] = dashboard
+        return dashboard
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """
+        Converts a user's search to an FTS5 query that matches all of its words.
+        Each word is quoted so punctuation can't be a syntax error, a trailing *
+        is kept as a prefix search.
+        """
+        terms = []
+        for word in query.split():
+            prefix = word.endswith("*")
+            word = word.rstrip("*")
+            if word:
+                terms.append('"' + word.replace('"', '""') + '"' + "*" * prefix)
+        return " ".join(terms)
+
+    def search_time_entries(
+        self, query: str, limit: int = 50, offset: int = 0
+    ) -> list[dict[str, Any]]:
+        """
+        Searches time entry descriptions, most recent match first, returning each
+        match with the saved invoice that covers it (if any). Matched words in the
+        description are wrapped in HIGHLIGHT_START and HIGHLIGHT_END.
+        The main db and every archive have their own index; each is searched in turn
+        for its latest matches and the results merged. Relevance scores from
+        separate indexes aren't comparable so results aren't ordered by them.
+        """
+        fts_query = self._fts_query(query)
+        if not fts_query:
+            return []
+        parameters = (
+            HIGHLIGHT_START,
+            HIGHLIGHT_END,
+            fts_query,
+            self.get_user_id(),
+            self.get_workspace_id(),
+            limit + offset,
+        )
+        rows = []
+        try:
+            with self.connect() as db:
+                query_sql = _SEARCH_QUERY.format(schema="main")
+                rows.extend(db.execute(query_sql, parameters).fetchall())
+            for schema, period_start, period_end in self._archives():
+                with self.connect_period(period_start, period_end) as db:
+                    query_sql = _SEARCH_QUERY.format(schema=schema)
+                    rows.extend(db.execute(query_sql, parameters).fetchall())
+        except sqlite3.OperationalError as e:
+            raise SearchError(f"Unable to search for '{query}': {e}")
+        rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+        rows = rows[offset : offset + limit]
+
+        return [
+            {
+                "id": row[0],
+                "date": datetime.datetime.strptime(row[1], self._DATE_FORMAT),
+                "duration_hours": row[2] / 3600,
+                "description": row[3],
+                "invoice_id": row[4],
+                "invoice_number": row[5],
+            }
+            for row in rows
+        ]
 
     def get_workspace_id(self) -> str | None:
         if not self._workspace_id:
@@ -1,25 +1,53 @@
+import contextlib
 import functools
+import gzip
+import http.client
+import importlib
 import logging
 import os
-import shutil
 import sqlite3
-import tempfile
+import sys
 from collections.abc import Callable
+from collections.abc import Generator
 from datetime import date
 from datetime import datetime
+from datetime import time
+from datetime import timedelta
 from datetime import timezone
 from typing import Any
 
 from flask import current_app
 from flask import make_response
 from flask import request
+from flask import Response
 
+from clockify_invoice.api import APIResponseParseException
 from clockify_invoice.api import ClockifyClient
 from clockify_invoice.api import ClockifySession
+from clockify_invoice.config import DATA_SOURCE_SUMMARY
+from clockify_invoice.invoice import TimeEntry
 from clockify_invoice.store import Store
 
 logger = logging.getLogger("clockify-invoice")
 
+try:
+    # Optional, install clockify-invoice[brotli] for brotli compressed responses
+    brotli: Any = importlib.import_module("brotli")
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIME_TYPES = frozenset(("text/html", "application/json"))
+# Smaller responses are not worth the compression overhead
+COMPRESSION_MIN_SIZE = 500
+
+# Called with the number of pages fetched and rows written so far
+SynchProgress = Callable[[int, int], None]
+
+TIME_ENTRY_UPSERT_EVENTS = frozenset(
+    ("NEW_TIME_ENTRY", "TIME_ENTRY_UPDATED", "TIMER_STOPPED")
+)
+TIME_ENTRY_DELETED_EVENTS = frozenset(("TIME_ENTRY_DELETED",))
+
 
 def auth_required(func: Callable[..., Any]) -> Any:
     @functools.wraps(func)
@@ -42,6 +70,55 @@ def auth_required(func: Callable[..., Any]) -> Any:
     return wrapper
 
 
+def _negotiate_encoding() -> str | None:
+    """Returns the best compression the client accepts, if any"""
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(encodings)
+
+
+def etag_matches(etag: str) -> bool:
+    """
+    Returns True if the request's If-None-Match matches the etag or one of its
+    compressed variants set by compress_response
+    """
+    return any(
+        request.if_none_match.contains(variant)
+        for variant in (etag, f"{etag}-gzip", f"{etag}-br")
+    )
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compresses HTML and JSON responses with brotli or gzip when the client
+    accepts it. A strong ETag is suffixed with the encoding so each encoding of
+    the response has its own validator.
+    """
+    response.vary.add("Accept-Encoding")
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or response.mimetype not in COMPRESSIBLE_MIME_TYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return response
+    if encoding == "br":
+        response.set_data(brotli.compress(data, quality=5))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
 def get_period_dates(start_year: int, start_month: int) -> tuple[date, date]:
     end_month = 1 if start_month == 12 else start_month + 1
     end_year = start_year + 1 if start_month == 12 else start_year
@@ -84,73 +161,297 @@ def synch_workspaces(api_session: ClockifyClient, db: sqlite3.Connection) -> Non
     db.executemany("INSERT INTO workspace VALUES(?,?)", workspaces_data)
 
 
+@functools.lru_cache(maxsize=None)
+def _local_utc_offset(day: date) -> timedelta | None:
+    """
+    Returns the local UTC offset in effect for the whole of the given UTC day, or
+    None if the offset changes during that day (i.e. a DST transition).
+    """
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1) - timedelta(seconds=1)
+    start_offset = start.astimezone(tz=None).utcoffset()
+    end_offset = end.astimezone(tz=None).utcoffset()
+    return start_offset if start_offset == end_offset else None
+
+
+def _utc_to_local(utc: datetime) -> datetime:
+    """Converts a naive UTC datetime to naive local time"""
+    offset = _local_utc_offset(utc.date())
+    if offset is None:
+        return utc.replace(tzinfo=timezone.utc).astimezone(tz=None).replace(tzinfo=None)
+    return utc + offset
+
+
+def _parse_utc(timestamp: str) -> datetime:
+    """Parses an ISO 8601 timestamp in UTC or with an offset to a naive UTC datetime"""
+    dt = datetime.fromisoformat(timestamp.removesuffix("Z"))
+    offset = dt.utcoffset()
+    if offset is not None:
+        dt = (dt - offset).replace(tzinfo=None)
+    return dt
+
+
+def convert_time_interval(start: str, end: str) -> tuple[str, str, float]:
+    """
+    Converts a clockify time interval (ISO 8601 strings, UTC or with an offset as
+    in report exports) to local start and end times in the Store date format and
+    the duration in seconds.
+
+    The local UTC offset is looked up once per day rather than once per timestamp
+    so converting large numbers of entries avoids repeated tz database lookups.
+    """
+    start_utc = _parse_utc(start)
+    end_utc = _parse_utc(end)
+    return (
+        _utc_to_local(start_utc).isoformat(" ", "seconds"),
+        _utc_to_local(end_utc).isoformat(" ", "seconds"),
+        (end_utc - start_utc).total_seconds(),
+    )
+
+
+def time_entry_row(
+    te: dict[str, Any], user_id: str, workspace_id: str
+) -> tuple[Any, ...] | None:
+    """
+    Converts a clockify time entry to a time entry row, see Store.upsert_time_entry.
+    Returns None if the entry has no end yet i.e. the timer is still going.
+    """
+    end = te["timeInterval"]["end"]
+    if end is None:
+        return None
+
+    start_time, end_time, duration_secs = convert_time_interval(
+        te["timeInterval"]["start"], end
+    )
+    return (
+        te["id"],
+        start_time,
+        end_time,
+        duration_secs,
+        te["description"],
+        user_id,
+        workspace_id,
+    )
+
+
 def synch_time_entries(
     api_session: ClockifyClient,
     db: sqlite3.Connection,
     user_id: str,
     workspace_id: str,
+    progress: SynchProgress | None = None,
 ) -> None:
-    time_entries = api_session.get_time_entries(workspace_id, user_id)
-    clockify_date_format = "%Y-%m-%dT%H:%M:%SZ"
-    data = []
-
-    def _convert_datestr(datestr: str) -> datetime:
-        return (
-            datetime.strptime(datestr, clockify_date_format)
-            .replace(tzinfo=timezone.utc)
-            .astimezone(tz=None)
-        )
+    rows_written = 0
+    pages = api_session.iter_time_entry_pages(workspace_id, user_id)
+    for pages_fetched, time_entries in enumerate(pages, 1):
+        data = []
+        for te in time_entries:
+            row = time_entry_row(te, user_id, workspace_id)
+            if row is not None:
+                data.append(row)
+        db.executemany("INSERT INTO time_entry VALUES(?,?,?,?,?,?,?)", data)
+        rows_written += len(data)
+        if progress is not None:
+            progress(pages_fetched, rows_written)
 
-    for te in time_entries:
-        end = te["timeInterval"]["end"]
-        if end is None:
-            # No end date. Is the timer still going?
-            continue
 
-        entry_id = te["id"]
-        desc = te["description"]
-        start = te["timeInterval"]["start"]
-        start_time = _convert_datestr(start)
-        end_time = _convert_datestr(end)
-        start_time_formatted = datetime.strftime(start_time, Store._DATE_FORMAT)
-        end_time_formatted = datetime.strftime(end_time, Store._DATE_FORMAT)
+def apply_time_entry_event(store: Store, event_type: str, te: dict[str, Any]) -> bool:
+    """
+    Applies a clockify time entry webhook event to the time_entry table.
+    Returns False if the event was ignored.
+    """
+    user_id, workspace_id = store.get_user_id(), store.get_workspace_id()
+    if not (user_id and workspace_id):
+        logger.warning(f"Ignoring {event_type}: the local db has not been synched")
+        return False
+    if te.get("userId") != user_id or te.get("workspaceId") != workspace_id:
+        logger.debug(f"Ignoring {event_type} for another user/workspace")
+        return False
+
+    if event_type in TIME_ENTRY_DELETED_EVENTS:
+        if not store.delete_time_entry(te["id"]):
+            logger.warning(f"Time entry [{te['id']}] is archived or was never synched")
+            return False
+    elif event_type in TIME_ENTRY_UPSERT_EVENTS:
+        row = time_entry_row(te, user_id, workspace_id)
+        if row is None or not store.upsert_time_entry(row):
+            return False
+    else:
+        logger.debug(f"Ignoring unsupported webhook event {event_type}")
+        return False
+    logger.info(f"Applied {event_type} for time entry [{te['id']}]")
+    return True
+
+
+class SynchInProgress(Exception):
+    pass
+
+
+class SummaryReportError(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def synch_lock(store: Store, blocking: bool = True) -> Generator[None, None, None]:
+    """
+    Holds an exclusive lock on a file in the store directory for the duration of
+    a synch, so processes sharing the directory (e.g. several containers mounting
+    the same CLOCKIFY_INVOICE_HOME) never synch at the same time.
+    Raises SynchInProgress if not blocking and the lock is held elsewhere.
+    """
+    with open(os.path.join(store.directory, "synch.lock"), "a+b") as f:
+        try:
+            _lock_file(f.fileno(), blocking)
+        except OSError:
+            raise SynchInProgress("A synch is already in progress")
+        try:
+            yield
+        finally:
+            _unlock_file(f.fileno())
+
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock_file(fd: int, blocking: bool) -> None:
+        mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+        while True:
+            try:
+                msvcrt.locking(fd, mode, 1)
+                return
+            except OSError:
+                # LK_LOCK only retries for 10 seconds
+                if not blocking:
+                    raise
+
+    def _unlock_file(fd: int) -> None:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_file(fd: int, blocking: bool) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
 
-        duration_secs = (end_time - start_time).total_seconds()
 
-        data.append(
+def synch_with_clockify(
+    store: Store, blocking: bool = True, progress: SynchProgress | None = None
+) -> int:
+    """
+    Replaces the local clockify data with the current data from clockify.
+    The data is staged while it downloads and swapped in with a single transaction,
+    so readers keep seeing the previous data until it commits and nothing changes
+    if the synch fails.
+    Raises SynchInProgress if not blocking and another synch holds the lock.
+    """
+    with (
+        synch_lock(store, blocking),
+        ClockifySession(
+            store.config.API_KEY,
+            cache_dir=store.http_cache_directory,
+            base_endpoint=store.config.API_URL,
+        ) as session,
+        store.connect() as db,
+    ):
+        logger.info("Synching the local db with clockify...")
+        client = ClockifyClient(session)
+        store.stage_clockify_tables(db)
+        user_id, workspace_id = synch_user(client, db)
+        synch_workspaces(client, db)
+        synch_time_entries(client, db, user_id, workspace_id, progress)
+        store.commit_clockify_tables(db)
+    return 0
+
+
+def _local_to_utc(day: date) -> datetime:
+    """Converts local midnight at the start of the day to a naive UTC datetime"""
+    return datetime.combine(day, time()).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def summary_report_rows(
+    report: dict[str, Any], period_end: date
+) -> list[tuple[str, str, float]]:
+    """
+    Converts a summary report grouped by description then date to rows of the
+    last date each description was worked on (in the Store date format), the
+    description and its total seconds
+    """
+    last_day = period_end - timedelta(days=1)
+    rows = []
+    for group in report.get("groupOne") or []:
+        days = []
+        for child in group.get("children") or []:
+            try:
+                days.append(date.fromisoformat(str(child.get("name"))[:10]))
+            except ValueError:
+                pass
+        day = max(days, default=last_day)
+        rows.append(
             (
-                entry_id,
-                start_time_formatted,
-                end_time_formatted,
-                duration_secs,
-                desc,
-                user_id,
-                workspace_id,
+                datetime.combine(day, time()).isoformat(" "),
+                group.get("name") or "",
+                float(group.get("duration") or 0),
             )
         )
-    db.executemany("INSERT INTO time_entry VALUES(?,?,?,?,?,?,?)", data)
+    return rows
 
 
-def synch_with_clockify(store: Store) -> int:
-    # Create a back up of the db
-    fd, backup_db = tempfile.mkstemp(dir=store.directory)
-    os.close(fd)
-    shutil.copy(store.db_path, backup_db)
+def fetch_period_summary(
+    store: Store, start: date, end: date
+) -> list[tuple[str, str, float]]:
+    """
+    Fetches the user's total time per description for the period (start
+    inclusive, end exclusive) with a single summary report request. The user is
+    only looked up from clockify if the db has not been synched.
+    """
+    user_id, workspace_id = store.get_user_id(), store.get_workspace_id()
+    if not (user_id and workspace_id):
+        with ClockifySession(
+            store.config.API_KEY,
+            cache_dir=store.http_cache_directory,
+            base_endpoint=store.config.API_URL,
+        ) as session:
+            user = ClockifyClient(session).get_user()
+        user_id = user["id"]
+        workspace_id = user["activeWorkspace"] or user["defaultWorkspace"]
+    with ClockifySession(
+        store.config.API_KEY, base_endpoint=store.config.REPORTS_API_URL
+    ) as session:
+        report = ClockifyClient(session).get_summary_report(
+            workspace_id, user_id, _local_to_utc(start), _local_to_utc(end)
+        )
+    return summary_report_rows(report, end)
+
+
+def get_invoice_time_entries(
+    store: Store, start: date, end: date, refresh: bool = False
+) -> list[TimeEntry]:
+    """
+    Returns the invoice time entries of the period from the configured data
+    source, either the synched db or clockify's summary report for the period.
+    Summaries are cached per period and refetched once stale. If clockify can't be
+    reached a stale summary is used, raises SummaryReportError if there is none.
+    A closed period's summary never goes stale, so refresh refetches the summary
+    regardless (e.g. after editing the period in clockify) and raises
+    SummaryReportError if it can't be fetched.
+    """
+    if store.config.DATA_SOURCE != DATA_SOURCE_SUMMARY:
+        return store.get_time_entries(start, end)
+    entries = None if refresh else store.get_period_summary(start, end)
+    if entries is not None:
+        return entries
     try:
-        store.clear_clockify_tables()
-        with (
-            ClockifySession(store.config.API_KEY) as session,
-            store.connect() as db,
-        ):
-            logger.info("Synching the local db with clockify...")
-            client = ClockifyClient(session)
-            user_id, workspace_id = synch_user(client, db)
-            synch_workspaces(client, db)
-            synch_time_entries(client, db, user_id, workspace_id)
-    except (KeyboardInterrupt, Exception):
-        # Something bad happened restore the db backup
-        os.replace(backup_db, store.db_path)
-        raise
-    else:
-        os.remove(backup_db)
-    return 0
+        rows = fetch_period_summary(store, start, end)
+    except (OSError, http.client.HTTPException, APIResponseParseException) as e:
+        if refresh:
+            raise SummaryReportError(f"Unable to refresh the summary report: {e}")
+        entries = store.get_period_summary(start, end, allow_stale=True)
+        if entries is None:
+            raise SummaryReportError(f"Unable to fetch the summary report: {e}")
+        logger.warning(f"Using a stale summary, unable to fetch the report: {e}")
+        return entries
+    logger.info(f"Fetched the summary report for {start} to {end}")
+    return store.save_period_summary(start, end, rows)
@@ -0,0 +1,89 @@
+"""
+Reports the size and render time of an invoice pdf under different weasyprint
+output options so the "pdf" config section can be tuned. The base64 size is what
+is stored in the db for each saved invoice.
+
+Usage: python -m testing.benchmark_pdf [--entries N] [--repeat N]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from collections.abc import Sequence
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+import tabulate
+
+from clockify_invoice.invoice import Client
+from clockify_invoice.invoice import Company
+from clockify_invoice.invoice import Invoice
+from clockify_invoice.invoice import PDFOptions
+from clockify_invoice.invoice import TimeEntry
+from clockify_invoice.main import app
+
+SETTINGS = {
+    "none": PDFOptions(optimize_size=()),
+    "fonts": PDFOptions(optimize_size=("fonts",)),
+    "images": PDFOptions(optimize_size=("images",)),
+    "fonts+images": PDFOptions(),
+    "pdf/a-3b": PDFOptions(variant="pdf/a-3b"),
+    "pdf/ua-1": PDFOptions(variant="pdf/ua-1"),
+}
+
+
+def make_invoice(entries: int) -> Invoice:
+    invoice = Invoice(
+        1,
+        Company("Test Company", "company@example.com", "123 456 789", 70.0),
+        Client("Test Client", "client@example.com", "Test Contact"),
+        date(2023, 3, 1),
+        date(2023, 4, 1),
+    )
+    first = datetime(2023, 3, 1, 9)
+    invoice.time_entries = [
+        TimeEntry(first + timedelta(hours=i), f"Task {i % 12}", 1.5, 70.0)
+        for i in range(entries)
+    ]
+    return invoice
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    invoice = make_invoice(args.entries)
+    rows = []
+    baseline = None
+    with app.test_request_context():
+        for name, options in SETTINGS.items():
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                pdf = invoice.pdf(options)
+                times.append(time.perf_counter() - start)
+            baseline = baseline or len(pdf)
+            rows.append(
+                (
+                    name,
+                    f"{len(pdf) / 1024:.1f}",
+                    f"{len(pdf) * 4 / 3 / 1024:.1f}",
+                    f"{len(pdf) / baseline:.0%}",
+                    f"{statistics.median(times) * 1000:.0f}",
+                )
+            )
+    print(
+        tabulate.tabulate(
+            rows,
+            headers=("settings", "pdf KiB", "base64 KiB", "size", "median ms"),
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+"""
+Benchmarks the conversion of clockify time intervals in synch_time_entries
+against the original strptime/astimezone/strftime implementation and checks
+both produce identical output, including around DST transitions.
+
+Usage: python -m testing.benchmark_time_entries [--entries N]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+import timeit
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from clockify_invoice.store import Store
+from clockify_invoice.utils import _local_utc_offset
+from clockify_invoice.utils import convert_time_interval
+
+CLOCKIFY_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+TIME_ZONES = (
+    "UTC",
+    "Australia/Brisbane",
+    "Australia/Sydney",
+    "Australia/Lord_Howe",
+    "America/New_York",
+    "Europe/London",
+)
+
+
+def reference_convert_time_interval(start: str, end: str) -> tuple[str, str, float]:
+    def _convert_datestr(datestr: str) -> datetime:
+        return (
+            datetime.strptime(datestr, CLOCKIFY_DATE_FORMAT)
+            .replace(tzinfo=timezone.utc)
+            .astimezone(tz=None)
+        )
+
+    start_time = _convert_datestr(start)
+    end_time = _convert_datestr(end)
+    return (
+        datetime.strftime(start_time, Store._DATE_FORMAT),
+        datetime.strftime(end_time, Store._DATE_FORMAT),
+        (end_time - start_time).total_seconds(),
+    )
+
+
+def make_intervals(count: int) -> list[tuple[str, str]]:
+    """
+    Generates intervals every 7 minutes from 2020 so that every DST transition
+    in the benchmarked time zones is crossed several times.
+    """
+    first = datetime(2020, 1, 1)
+    step = timedelta(minutes=7)
+    intervals = []
+    for i in range(count):
+        start = first + step * i
+        end = start + timedelta(minutes=45)
+        intervals.append(
+            (start.strftime(CLOCKIFY_DATE_FORMAT), end.strftime(CLOCKIFY_DATE_FORMAT))
+        )
+    return intervals
+
+
+def set_time_zone(tz: str) -> None:
+    os.environ["TZ"] = tz
+    time.tzset()
+    _local_utc_offset.cache_clear()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    intervals = make_intervals(args.entries)
+    ret = 0
+    for tz in TIME_ZONES:
+        set_time_zone(tz)
+        expected = [reference_convert_time_interval(*i) for i in intervals]
+        _local_utc_offset.cache_clear()
+        actual = [convert_time_interval(*i) for i in intervals]
+        mismatches = sum(a != e for a, e in zip(actual, expected))
+        if mismatches:
+            ret = 1
+
+        reference = timeit.timeit(
+            lambda: [reference_convert_time_interval(*i) for i in intervals],
+            number=1,
+        )
+        _local_utc_offset.cache_clear()
+        fast = timeit.timeit(
+            lambda: [convert_time_interval(*i) for i in intervals],
+            number=1,
+        )
+        print(
+            f"{tz:<20} "
+            f"reference {reference / len(intervals) * 1e6:6.2f}us/entry  "
+            f"fast {fast / len(intervals) * 1e6:6.2f}us/entry  "
+            f"speedup {reference / fast:5.1f}x  "
+            f"mismatches {mismatches}"
+        )
+    return ret
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
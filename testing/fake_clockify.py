@@ -0,0 +1,280 @@
+"""
+A local stand-in for the clockify API serving a large, generated dataset with
+injectable latency, rate limiting (429) and server errors.
+
+Point clockify-invoice at it by setting "api_url" in the config file to
+http://localhost:8080/api/v1 (with the default --port). It also serves summary
+reports grouped by description then date, set "reports_api_url" to
+http://localhost:8080/reports/v1 to use them.
+
+Usage: python -m testing.fake_clockify [--entries N] [--latency MS] ...
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import gzip
+import json
+import random
+import re
+import time
+import urllib.parse
+from collections import defaultdict
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timedelta
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+
+from testing.mock_responses import GET_USER
+from testing.mock_responses import WEBHOOK_TIME_ENTRY
+
+USER_ID = GET_USER["id"]
+WORKSPACE_ID = GET_USER["activeWorkspace"]
+DESCRIPTIONS = (
+    "Development",
+    "Code review",
+    "Meetings",
+    "Deployment",
+    "Support",
+    "Planning",
+    "Documentation",
+    "Bug fixing",
+)
+TIME_ENTRIES_PATH = re.compile(
+    r"/api/v1/workspaces/(?P<workspace>[^/]+)/user/(?P<user>[^/]+)/time-entries"
+)
+SUMMARY_REPORT_PATH = re.compile(
+    r"/reports/v1/workspaces/(?P<workspace>[^/]+)/reports/summary"
+)
+CLOCKIFY_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+ENTRY_INTERVAL = timedelta(hours=4)
+
+
+class FakeClockifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        entries: int,
+        descriptions: int,
+        latency: float,
+        rate_limit: float,
+        error_rate: float,
+        seed: int,
+    ) -> None:
+        super().__init__(address, FakeClockifyHandler)
+        self.entries = entries
+        self.descriptions = descriptions
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.seed = seed
+        # Entries are spread back from now, newest first as clockify returns them
+        self.first_start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    def time_entry(self, index: int) -> dict[str, Any]:
+        """Deterministically generates the time entry at index"""
+        rand = random.Random(self.seed * 1_000_003 + index)
+        start = self.first_start - ENTRY_INTERVAL * index
+        end = start + timedelta(minutes=rand.randrange(15, 240, 15))
+        description = DESCRIPTIONS[index % len(DESCRIPTIONS)]
+        if self.descriptions > len(DESCRIPTIONS):
+            description += f" #{rand.randrange(self.descriptions)}"
+        entry = copy.deepcopy(WEBHOOK_TIME_ENTRY)
+        entry.update(
+            {
+                "id": f"fake{index:012d}",
+                "description": description,
+                "timeInterval": {
+                    "start": start.strftime(CLOCKIFY_DATE_FORMAT),
+                    "end": end.strftime(CLOCKIFY_DATE_FORMAT),
+                    "duration": f"PT{int((end - start).total_seconds() // 60)}M",
+                },
+            }
+        )
+        return entry
+
+    def summary_report(self, start: datetime, end: datetime) -> dict[str, Any]:
+        """
+        Summarises the entries starting between start and end (inclusive), naive
+        UTC datetimes, grouped by description then date
+        """
+        first = max(0, -((end - self.first_start) // ENTRY_INTERVAL))
+        last = min(self.entries - 1, (self.first_start - start) // ENTRY_INTERVAL)
+        groups: defaultdict[str, defaultdict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        for index in range(first, last + 1):
+            entry = self.time_entry(index)
+            interval = entry["timeInterval"]
+            entry_start = datetime.strptime(interval["start"], CLOCKIFY_DATE_FORMAT)
+            if not start <= entry_start <= end:
+                continue
+            entry_end = datetime.strptime(interval["end"], CLOCKIFY_DATE_FORMAT)
+            seconds = int((entry_end - entry_start).total_seconds())
+            groups[entry["description"]][entry_start.date().isoformat()] += seconds
+        group_one = [
+            {
+                "_id": description,
+                "name": description,
+                "duration": sum(days.values()),
+                "children": [
+                    {"_id": day, "name": day, "duration": seconds}
+                    for day, seconds in sorted(days.items())
+                ],
+            }
+            for description, days in groups.items()
+        ]
+        total = sum(sum(days.values()) for days in groups.values())
+        return {"totals": [{"totalTime": total}], "groupOne": group_one}
+
+
+class FakeClockifyHandler(BaseHTTPRequestHandler):
+    server: FakeClockifyServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, body: Any, status: int = HTTPStatus.OK) -> None:
+        data = json.dumps(body).encode()
+        headers = {"Content-Type": "application/json"}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_faults(self) -> bool:
+        """Sleeps for the configured latency and maybe fails. True if it failed."""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.rate_limit:
+            self.send_response(HTTPStatus.TOO_MANY_REQUESTS)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        if random.random() < self.server.error_rate:
+            self._send_json({"message": "Injected error", "code": 500}, 500)
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if self.headers.get("X-Api-Key") is None:
+            self._send_json({"message": "Missing api key", "code": 401}, 401)
+            return
+        if self._inject_faults():
+            return
+
+        if url.path == "/api/v1/user":
+            self._send_json(GET_USER)
+        elif url.path == "/api/v1/workspaces":
+            self._send_json(
+                [
+                    {"id": WORKSPACE_ID, "name": "Test Workspace"},
+                    {"id": GET_USER["defaultWorkspace"], "name": "Default Workspace"},
+                ]
+            )
+        elif match := TIME_ENTRIES_PATH.fullmatch(url.path):
+            if match["user"] != USER_ID or match["workspace"] != WORKSPACE_ID:
+                self._send_json([])
+                return
+            query = urllib.parse.parse_qs(url.query)
+            page = int(query.get("page", ["1"])[0])
+            page_size = int(query.get("page-size", ["50"])[0])
+            first = (page - 1) * page_size
+            last = min(first + page_size, self.server.entries)
+            self._send_json([self.server.time_entry(i) for i in range(first, last)])
+        else:
+            self._send_json({"message": "Not found", "code": 404}, 404)
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("X-Api-Key") is None:
+            self._send_json({"message": "Missing api key", "code": 401}, 401)
+            return
+        if self._inject_faults():
+            return
+
+        if match := SUMMARY_REPORT_PATH.fullmatch(url.path):
+            if match["workspace"] != WORKSPACE_ID:
+                self._send_json({"totals": [], "groupOne": []})
+                return
+            try:
+                query = json.loads(body)
+                start = datetime.fromisoformat(query["dateRangeStart"].rstrip("Z"))
+                end = datetime.fromisoformat(query["dateRangeEnd"].rstrip("Z"))
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json({"message": f"Invalid report: {e}", "code": 400}, 400)
+                return
+            if USER_ID not in query.get("users", {}).get("ids", [USER_ID]):
+                self._send_json({"totals": [], "groupOne": []})
+                return
+            self._send_json(self.server.summary_report(start, end))
+        else:
+            self._send_json({"message": "Not found", "code": 404}, 404)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--entries", type=int, default=100_000, help="time entries (%(default)s)"
+    )
+    parser.add_argument(
+        "--descriptions",
+        type=int,
+        default=len(DESCRIPTIONS),
+        help="distinct descriptions (%(default)s)",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="ms added to each response"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0,
+        help="probability of a 429 response (0-1)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="probability of a 500 response (0-1)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = FakeClockifyServer(
+        (args.host, args.port),
+        args.entries,
+        args.descriptions,
+        args.latency / 1000,
+        args.rate_limit,
+        args.error_rate,
+        args.seed,
+    )
+    print(f"Fake clockify API on http://{args.host}:{args.port}/api/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""
+Runs concurrent simulated users against a running clockify-invoice server and
+reports latency percentiles and error rates per endpoint.
+
+Each user keeps its own session cookie and repeatedly generates an invoice
+(POST /), downloads it, saves it and occasionally starts a synch. Run the server
+against testing/fake_clockify.py to include synchs without hitting clockify.
+
+Saving stores real invoices and uses up invoice numbers, so only run it against a
+server with a scratch CLOCKIFY_INVOICE_HOME, never the one holding your invoices.
+
+Usage: python -m testing.load_test [--url URL] [--users N] [--duration S] ...
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import http.cookiejar
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from collections.abc import Sequence
+from datetime import date
+from typing import Any
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Reports redirects as responses so each request is timed on its own"""
+
+    def redirect_request(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+
+class Results:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: defaultdict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def report(self, elapsed: float) -> None:
+        print(
+            f"{'endpoint':<12} {'requests':>9} {'req/s':>8} {'errors':>7} "
+            f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        )
+        for name, latencies in sorted(self.latencies.items()):
+            count = len(latencies)
+            if count > 1:
+                p = statistics.quantiles(latencies, n=100, method="inclusive")
+                p50, p90, p99 = p[49], p[89], p[98]
+            else:
+                p50 = p90 = p99 = latencies[0]
+            print(
+                f"{name:<12} {count:>9} {count / elapsed:>8.1f} "
+                f"{self.errors[name] / count:>7.1%} "
+                f"{p50 * 1000:>8.1f} {p90 * 1000:>8.1f} {p99 * 1000:>8.1f} "
+                f"{max(latencies) * 1000:>8.1f}"
+            )
+
+
+class User(threading.Thread):
+    def __init__(
+        self,
+        url: str,
+        results: Results,
+        deadline: float,
+        synch_probability: float,
+        auth: str | None,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.url = url.rstrip("/")
+        self.results = results
+        self.deadline = deadline
+        self.synch_probability = synch_probability
+        self.headers: dict[str, str] = {}
+        if auth is not None:
+            token = base64.b64encode(auth.encode()).decode()
+            self.headers["Authorization"] = f"Basic {token}"
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect,
+        )
+
+    def request(self, name: str, path: str, data: dict[str, Any] | None = None) -> None:
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(
+            f"{self.url}{path}", data=body, headers=self.headers
+        )
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                ok = True
+        except urllib.error.HTTPError as e:
+            # Redirects are how the app finishes /save, /download and /synch
+            ok = 300 <= e.code < 400
+            e.read()
+        except OSError:
+            ok = False
+        self.results.record(name, time.perf_counter() - start, ok)
+
+    def run(self) -> None:
+        # The first page load reserves an invoice number for the session. The form
+        # omits the number so each invoice is saved under the session's reservation
+        self.request("GET /", "/")
+        while time.monotonic() < self.deadline:
+            year = random.randint(date.today().year - 2, date.today().year)
+            month = random.randint(1, 12)
+            self.request(
+                "POST /",
+                "/",
+                {
+                    "year": year,
+                    "month": month,
+                    "financial-year": year - (month < 7),
+                },
+            )
+            self.request("/download", "/download")
+            self.request("/save", "/save")
+            if random.random() < self.synch_probability:
+                self.request("/synch", "/synch")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument(
+        "--synch-probability",
+        type=float,
+        default=0.05,
+        help="chance a user starts a synch each iteration (%(default)s)",
+    )
+    parser.add_argument("--auth", help="basic auth credentials as user:password")
+    args = parser.parse_args(argv)
+
+    results = Results()
+    start = time.monotonic()
+    users = [
+        User(
+            args.url,
+            results,
+            start + args.duration,
+            args.synch_probability,
+            args.auth,
+        )
+        for _ in range(args.users)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - start
+
+    if not results.latencies:
+        print("No requests completed")
+        return 1
+    results.report(elapsed)
+    return 1 if any(results.errors.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
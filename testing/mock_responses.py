@@ -1,3 +1,7 @@
+from __future__ import annotations
+
+from typing import Any
+
 GET_USER = {
     "id": "1234ABCD",
     "email": "test.email@gmail.com",
@@ -40,3 +44,35 @@ GET_USER = {
     "status": "ACTIVE",
     "customFields": [],
 }
+
+# Recorded clockify webhook payload for a NEW_TIME_ENTRY/TIME_ENTRY_UPDATED event
+WEBHOOK_TIME_ENTRY: dict[str, Any] = {
+    "id": "64a1b2c3d4e5f6a7b8c9d0e1",
+    "description": "Test webhook time entry",
+    "tagIds": None,
+    "userId": "1234ABCD",
+    "billable": True,
+    "taskId": None,
+    "projectId": None,
+    "timeInterval": {
+        "start": "2023-07-03T00:00:00Z",
+        "end": "2023-07-03T02:30:00Z",
+        "duration": "PT2H30M",
+    },
+    "workspaceId": "test-active-workspace",
+    "isLocked": False,
+    "hourlyRate": None,
+    "costRate": None,
+    "customFieldValues": [],
+    "type": "REGULAR",
+    "kioskId": None,
+    "currentlyRunning": False,
+    "project": None,
+    "task": None,
+    "user": {
+        "id": "1234ABCD",
+        "name": "Test User",
+        "status": "ACTIVE",
+    },
+    "tags": [],
+}
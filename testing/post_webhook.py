@@ -0,0 +1,48 @@
+"""
+Posts a recorded clockify webhook payload to a running clockify-invoice server.
+
+Usage: python -m testing.post_webhook SECRET [--event TIME_ENTRY_UPDATED]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import urllib.request
+from collections.abc import Sequence
+
+from testing.mock_responses import WEBHOOK_TIME_ENTRY
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("secret", help="the webhook secret in the config file")
+    parser.add_argument("--url", default="http://localhost:5000/webhooks/clockify")
+    parser.add_argument(
+        "--event",
+        default="NEW_TIME_ENTRY",
+        choices=(
+            "NEW_TIME_ENTRY",
+            "TIME_ENTRY_UPDATED",
+            "TIMER_STOPPED",
+            "TIME_ENTRY_DELETED",
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    req = urllib.request.Request(
+        args.url,
+        data=json.dumps(WEBHOOK_TIME_ENTRY).encode(),
+        headers={
+            "Content-Type": "application/json",
+            "Clockify-Signature": args.secret,
+            "Clockify-Webhook-Event-Type": args.event,
+        },
+        method="POST",
+    )
+    with urllib.request.urlopen(req) as res:
+        print(res.status, res.reason)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from clockify_invoice.main import app
+from clockify_invoice.store import _SAMPLE_CONFIG
+from clockify_invoice.store import Store
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """A store directory with a config file, used by any Store created in the test"""
+    monkeypatch.setenv("CLOCKIFY_INVOICE_HOME", str(tmp_path))
+    config = json.loads(_SAMPLE_CONFIG)
+    config["api_key"] = "test-api-key"
+    (tmp_path / "clockify-invoice-config.json").write_text(json.dumps(config))
+    return tmp_path
+
+
+@pytest.fixture
+def store(home):
+    return Store()
+
+
+@pytest.fixture
+def request_context():
+    """Invoices render their pdf from the app's templates, which build urls"""
+    with app.test_request_context():
+        yield
+
+
+@pytest.fixture
+def client(store):
+    app.config["store"] = store
+    app.config["TESTING"] = True
+    app.secret_key = store.config.API_KEY
+    return app.test_client()
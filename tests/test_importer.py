@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import io
+import json
+from datetime import date
+
+import pytest
+
+from clockify_invoice import importer
+from clockify_invoice.importer import iter_csv_rows
+from clockify_invoice.importer import iter_import_rows
+from clockify_invoice.importer import iter_json_rows
+from clockify_invoice.importer import TimeEntryImportError
+from clockify_invoice.utils import convert_time_interval
+
+_CSV_HEADER = (
+    "Project,Description,Email,Start Date,Start Time,End Date,End Time,"
+    "Duration (decimal)\n"
+)
+
+_CSV = (
+    _CSV_HEADER
+    + "Client,Meeting,user@example.com,05/01/2023,09:00:00,05/01/2023,09:30:00,0.50\n"
+    + "Client,Review,other@example.com,05/01/2023,10:00:00,05/01/2023,11:00:00,1.00\n"
+    + "Client,Deploy,USER@example.com,05/02/2023,11:45 PM,05/03/2023,12:15 AM,\n"
+)
+
+
+def _csv_rows(text, **kwargs):
+    return list(iter_csv_rows(io.StringIO(text), "user", "workspace", **kwargs))
+
+
+def test_csv_rows_are_converted_to_time_entries():
+    rows = _csv_rows(_CSV, user_email="user@example.com")
+
+    assert [row[1:] for row in rows] == [
+        (
+            "2023-05-01 09:00:00",
+            "2023-05-01 09:30:00",
+            1800,
+            "Meeting",
+            "user",
+            "workspace",
+        ),
+        # Without a decimal duration it comes from the times
+        (
+            "2023-05-02 23:45:00",
+            "2023-05-03 00:15:00",
+            1800,
+            "Deploy",
+            "user",
+            "workspace",
+        ),
+    ]
+    assert all(row[0].startswith("csv-") for row in rows)
+
+
+def test_csv_ids_are_the_same_when_imported_again():
+    first = _csv_rows(_CSV)
+    again = _csv_rows(_CSV)
+
+    assert [row[0] for row in first] == [row[0] for row in again]
+    assert len({row[0] for row in first}) == 3
+
+
+def test_csv_date_format_and_iso_dates():
+    text = (
+        _CSV_HEADER
+        + "Client,Meeting,,01/05/2023,09:00,01/05/2023,09:30,\n"
+        + "Client,Review,,2023-05-02,09:00,2023-05-02,09:15,\n"
+    )
+
+    rows = _csv_rows(text, date_format="%d/%m/%Y")
+
+    assert [row[1] for row in rows] == ["2023-05-01 09:00:00", "2023-05-02 09:00:00"]
+
+
+def test_csv_without_the_report_columns_raises():
+    with pytest.raises(TimeEntryImportError, match="no 'Start Date'"):
+        _csv_rows("Description,Start Time\nMeeting,09:00\n")
+
+
+def test_csv_invalid_entry_reports_its_line():
+    text = _CSV_HEADER + "Client,Meeting,,05/01/2023,9 o'clock,05/01/2023,09:30,\n"
+
+    with pytest.raises(TimeEntryImportError, match="line 2"):
+        _csv_rows(text)
+
+
+def test_empty_csv_has_no_rows():
+    assert _csv_rows("") == []
+
+
+def _json_entry(entry_id, start, end, description="Meeting", **fields):
+    return {
+        "_id": entry_id,
+        "description": description,
+        "timeInterval": {"start": start, "end": end},
+        **fields,
+    }
+
+
+_JSON_ENTRIES = [
+    _json_entry(
+        "a", "2023-05-01T09:00:00Z", "2023-05-01T09:30:00Z", userEmail="user@x.com"
+    ),
+    _json_entry(
+        "b", "2023-05-01T10:00:00Z", "2023-05-01T11:00:00Z", userEmail="other@x.com"
+    ),
+    # A running timer
+    _json_entry("c", "2023-05-01T12:00:00Z", None),
+    # Report exports have an offset and API entries have an id rather than _id
+    {
+        "id": "d",
+        "description": None,
+        "timeInterval": {
+            "start": "2023-05-02T09:00:00+10:00",
+            "end": "2023-05-02T09:15:00+10:00",
+        },
+    },
+]
+
+
+def _json_rows(text, **kwargs):
+    return list(iter_json_rows(io.StringIO(text), "user", "workspace", **kwargs))
+
+
+def _expected_json_row(entry_id, start, end, description):
+    return (entry_id, *convert_time_interval(start, end), description)
+
+
+@pytest.mark.parametrize(
+    "export",
+    (_JSON_ENTRIES, {"totals": [{"id": None}], "timeentries": _JSON_ENTRIES}),
+)
+def test_json_rows_are_converted_to_time_entries(export):
+    rows = _json_rows(json.dumps(export), user_email="USER@x.com")
+
+    assert [row[:5] for row in rows] == [
+        _expected_json_row(
+            "a", "2023-05-01T09:00:00Z", "2023-05-01T09:30:00Z", "Meeting"
+        ),
+        _expected_json_row(
+            "d", "2023-05-02T09:00:00+10:00", "2023-05-02T09:15:00+10:00", ""
+        ),
+    ]
+    assert rows[1][3] == 900
+
+
+def test_json_entries_split_across_reads(monkeypatch):
+    monkeypatch.setattr(importer, "JSON_CHUNK_SIZE", 7)
+    export = {"timeEntries": _JSON_ENTRIES}
+
+    rows = _json_rows(json.dumps(export, indent=2))
+
+    assert [row[0] for row in rows] == ["a", "b", "d"]
+
+
+@pytest.mark.parametrize(
+    "text, match",
+    (
+        ('{"totals": []}', "no time entries"),
+        ('[{"_id": "a", "timeInterval": {"start": "2023-', "Invalid JSON export"),
+        ('[{"_id": "a"}]', "Invalid time entry"),
+    ),
+)
+def test_invalid_json_raises(text, match):
+    with pytest.raises(TimeEntryImportError, match=match):
+        _json_rows(text)
+
+
+def test_import_rows_by_extension(tmp_path):
+    # Excel saves CSV files with a byte order mark
+    csv_path = tmp_path / "report.CSV"
+    csv_path.write_text(_CSV, encoding="utf-8-sig")
+    json_path = tmp_path / "report.json"
+    json_path.write_text(json.dumps(_JSON_ENTRIES))
+
+    csv_rows = list(iter_import_rows(str(csv_path), "user", "workspace"))
+    json_rows = list(iter_import_rows(str(json_path), "user", "workspace"))
+
+    assert [row[4] for row in csv_rows] == ["Meeting", "Review", "Deploy"]
+    assert [row[0] for row in json_rows] == ["a", "b", "d"]
+    with pytest.raises(TimeEntryImportError, match="expected one of .csv, .json"):
+        list(iter_import_rows(str(tmp_path / "report.xlsx"), "user", "workspace"))
+
+
+def test_importing_a_csv_again_changes_nothing(store, tmp_path):
+    path = tmp_path / "report.csv"
+    path.write_text(_CSV)
+    user_id, workspace_id, user_email = store.get_or_create_import_user()
+
+    for _ in range(2):
+        rows = iter_import_rows(str(path), user_id, workspace_id, user_email)
+        assert store.import_time_entries(rows) == 3
+
+    exported = store.iter_time_entries(date(2023, 5, 1), date(2023, 6, 1))
+    assert [row[4] for row in exported] == ["Meeting", "Review", "Deploy"]
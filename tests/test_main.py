@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+
+import pytest
+
+from clockify_invoice import jobs
+from clockify_invoice import main
+from clockify_invoice.config import DATA_SOURCE_SUMMARY
+from clockify_invoice.invoice import Invoice
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Records the periods the app loads time entries for instead of loading them"""
+    calls = []
+
+    def get_invoice_time_entries(store, start, end, refresh=False):
+        calls.append((start, end, refresh))
+        return []
+
+    monkeypatch.setattr(main, "get_invoice_time_entries", get_invoice_time_entries)
+    return calls
+
+
+def test_refresh_summary_button_reaches_its_route(store, client, fetches):
+    store.config.DATA_SOURCE = DATA_SOURCE_SUMMARY
+    page = client.get("/").data.decode()
+
+    button = re.search(r'<button[^>]*formaction="([^"]+)"[^>]*>\s*Refresh', page)
+    assert button is not None
+    # The preview's submit handler must let buttons with a formaction through
+    assert "event.submitter.hasAttribute('formaction')" in page
+
+    response = client.post(
+        button.group(1),
+        data={"year": 2023, "month": 5, "invoice-number": 1, "financial-year": 2022},
+    )
+
+    assert response.status_code == 200
+    assert (date(2023, 5, 1), date(2023, 6, 1), True) in fetches
+
+
+def test_saving_under_a_manual_number_releases_the_reservation(store, client, fetches):
+    client.get("/")
+    with client.session_transaction() as session:
+        reserved = session["invoice-number"]
+    client.post("/", data={"year": 2023, "month": 5, "invoice-number": reserved + 5})
+
+    client.get("/save")
+
+    with client.session_transaction() as session:
+        assert "invoice-number" not in session
+    assert [i["invoice_number"] for i in store.get_invoices(2022)] == [reserved + 5]
+    assert store.reserve_invoice_number() == reserved
+
+
+def test_invoice_pdf_is_cached_by_content_and_save_time(store, client):
+    saved_after = datetime.now(timezone.utc).replace(microsecond=0)
+    with main.app.test_request_context():
+        invoice = Invoice(
+            1,
+            store.config.COMPANY,
+            store.config.CLIENT,
+            date(2023, 5, 1),
+            date(2023, 6, 1),
+            invoice_date=date(2023, 6, 1),
+        )
+        store.save_invoice(invoice)
+    invoice_id = store.get_invoices(2022)[0]["invoice_id"]
+
+    response = client.get(f"/invoice/{invoice_id}/pdf")
+
+    assert response.get_etag() == (hashlib.sha256(response.data).hexdigest(), False)
+    assert response.last_modified >= saved_after
+    cached = client.get(
+        f"/invoice/{invoice_id}/pdf",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert cached.status_code == 304
+
+
+@pytest.mark.parametrize("debug, profiled", [([], False), (["--debug"], True)])
+def test_requests_are_only_profiled_in_debug_mode(home, monkeypatch, debug, profiled):
+    calls = []
+
+    def run_interactive(store, profile_requests):
+        calls.append(profile_requests)
+        return 0
+
+    monkeypatch.setattr(main, "run_interactive", run_interactive)
+
+    assert main.main(["-i", "--profile", *debug]) == 0
+
+    assert calls == [profiled]
+
+
+def test_profiled_synch_request_profiles_the_synch_job(store, client, monkeypatch):
+    monkeypatch.setattr(jobs, "synch_with_clockify", lambda store, progress: 0)
+    monkeypatch.setitem(main.app.config, main.FLASK_CONFIG_PROFILE_KEY, True)
+
+    client.get("/synch?profile")
+
+    with client.session_transaction() as session:
+        job = main.synch_jobs.get(session["synch-job"])
+    assert job is not None
+    for thread in threading.enumerate():
+        if thread.name == f"synch-{job.id}":
+            thread.join()
+    assert job.status == job.SUCCEEDED
+    profiles = os.listdir(store.profile_directory)
+    assert any(name.endswith(f"synch-{job.id}.pstats") for name in profiles)
+    assert any("request-synch" in name for name in profiles)
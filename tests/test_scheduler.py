@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+from clockify_invoice.scheduler import _seconds_between
+from clockify_invoice.scheduler import CronError
+from clockify_invoice.scheduler import CronExpression
+from clockify_invoice.scheduler import scheduler_from_config
+from clockify_invoice.scheduler import SynchScheduler
+
+
+@pytest.fixture
+def sydney(monkeypatch):
+    """Local time is Sydney's, clocks go forward on 1 Oct 2023 and back on 7 Apr 2024"""
+    monkeypatch.setenv("TZ", "Australia/Sydney")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_parses_ranges_lists_and_steps():
+    cron = CronExpression("*/15 8-18/5 1,15-17 * 1-5")
+
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == {8, 13, 18}
+    assert cron.days == {1, 15, 16, 17}
+    assert cron.months == set(range(1, 13))
+    assert cron.weekdays == {1, 2, 3, 4, 5}
+
+
+def test_a_value_with_a_step_runs_to_the_end_of_the_range():
+    assert CronExpression("5/20 * * * *").minutes == {5, 25, 45}
+
+
+def test_sunday_is_0_or_7():
+    assert CronExpression("0 0 * * 7").weekdays == {0}
+    assert CronExpression("0 0 * * 5-7").weekdays == {0, 5, 6}
+
+
+@pytest.mark.parametrize(
+    "expression",
+    (
+        "* * * *",
+        "* * * * * *",
+        "60 * * * *",
+        "* 24 * * *",
+        "* * 0 * *",
+        "* * * 13 *",
+        "* * * * 8",
+        "5-1 * * * *",
+        "*/0 * * * *",
+        "a * * * *",
+        "1-2-3 * * * *",
+    ),
+)
+def test_invalid_expression_raises(expression):
+    with pytest.raises(CronError):
+        CronExpression(expression)
+
+
+@pytest.mark.parametrize(
+    "expression, after, expected",
+    (
+        # The next minute, never the one given
+        ("* * * * *", datetime(2023, 5, 1, 9, 0, 30), datetime(2023, 5, 1, 9, 1)),
+        ("0 9 * * *", datetime(2023, 5, 1, 9), datetime(2023, 5, 2, 9)),
+        ("*/15 * * * *", datetime(2023, 5, 1, 9, 50), datetime(2023, 5, 1, 10)),
+        ("30 9 * * *", datetime(2023, 12, 31, 10), datetime(2024, 1, 1, 9, 30)),
+        ("0 0 1 1 *", datetime(2023, 5, 1), datetime(2024, 1, 1)),
+        # Months without the day are skipped
+        ("0 9 31 * *", datetime(2023, 9, 1), datetime(2023, 10, 31, 9)),
+        ("0 0 29 2 *", datetime(2023, 3, 1), datetime(2024, 2, 29)),
+    ),
+)
+def test_next_after(expression, after, expected):
+    assert CronExpression(expression).next_after(after) == expected
+
+
+@pytest.mark.parametrize(
+    "expression, after, expected",
+    (
+        # Only the weekday is restricted, Sunday 1 Oct to Monday
+        ("0 9 * * 1", datetime(2023, 10, 1), datetime(2023, 10, 2, 9)),
+        # Only the day is restricted, whatever the weekday
+        ("0 9 10 * *", datetime(2023, 10, 1), datetime(2023, 10, 10, 9)),
+        # Both are restricted so either matches, the 10th is a Tuesday
+        ("0 9 10 * 5", datetime(2023, 10, 7), datetime(2023, 10, 10, 9)),
+        ("0 9 10 * 5", datetime(2023, 10, 1), datetime(2023, 10, 6, 9)),
+        # Both restricted with days that aren't in the month, Fridays still match
+        ("0 9 31 2 5", datetime(2024, 2, 1), datetime(2024, 2, 2, 9)),
+    ),
+)
+def test_day_of_month_and_day_of_week(expression, after, expected):
+    assert CronExpression(expression).next_after(after) == expected
+
+
+def test_expression_that_never_matches_raises():
+    with pytest.raises(CronError):
+        CronExpression("0 0 31 2 *").next_after(datetime(2023, 1, 1))
+
+
+@pytest.mark.usefixtures("sydney")
+@pytest.mark.parametrize(
+    "after, hours",
+    (
+        (datetime(2023, 9, 30, 9), 23),
+        (datetime(2024, 4, 6, 9), 25),
+        (datetime(2024, 5, 1, 9), 24),
+    ),
+)
+def test_daily_run_keeps_its_wall_clock_time_across_daylight_saving(after, hours):
+    next_run = CronExpression("0 9 * * *").next_after(after)
+
+    assert next_run == after + timedelta(days=1)
+    assert _seconds_between(after, next_run) == hours * 3600
+
+
+@pytest.mark.usefixtures("sydney")
+def test_run_in_the_daylight_saving_gap_is_an_hour_later():
+    after = datetime(2023, 9, 30, 3)
+
+    next_run = CronExpression("30 2 * * *").next_after(after)
+
+    assert next_run == datetime(2023, 10, 1, 2, 30)
+    assert datetime.fromtimestamp(next_run.timestamp()) == datetime(2023, 10, 1, 3, 30)
+    assert _seconds_between(after, next_run) == 23.5 * 3600
+
+
+def test_next_run_adds_up_to_the_jitter(store):
+    now = datetime(2023, 5, 1, 9, 10)
+    jitter = timedelta(minutes=5)
+    interval = SynchScheduler(store, interval=timedelta(hours=1), jitter=jitter)
+    cron = SynchScheduler(store, cron=CronExpression("0 * * * *"), jitter=jitter)
+
+    for _ in range(20):
+        next_run = interval.next_run(now)
+        assert now + timedelta(hours=1) <= next_run <= now + timedelta(hours=1) + jitter
+        assert (
+            datetime(2023, 5, 1, 10)
+            <= cron.next_run(now)
+            <= datetime(2023, 5, 1, 10, 5)
+        )
+
+
+def test_scheduler_needs_an_interval_or_a_cron_expression(store):
+    with pytest.raises(ValueError):
+        SynchScheduler(store)
+    with pytest.raises(ValueError):
+        SynchScheduler(
+            store, interval=timedelta(hours=1), cron=CronExpression("* * * * *")
+        )
+
+
+def test_scheduler_from_config(store):
+    store.config.SYNCH_CRON = ""
+    store.config.SYNCH_INTERVAL_MINUTES = 0
+    assert scheduler_from_config(store) is None
+
+    store.config.SYNCH_INTERVAL_MINUTES = 30
+    scheduler = scheduler_from_config(store)
+    assert scheduler is not None
+    assert scheduler.interval == timedelta(minutes=30)
+
+    # A cron expression takes precedence
+    store.config.SYNCH_CRON = "0 9 * * 1-5"
+    scheduler = scheduler_from_config(store)
+    assert scheduler is not None
+    assert scheduler.cron is not None
+    assert scheduler.interval is None
+
+    store.config.SYNCH_CRON = "0 0 30 2 *"
+    with pytest.raises(CronError):
+        scheduler_from_config(store)
@@ -0,0 +1,447 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import sqlite3
+import threading
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+from clockify_invoice.invoice import Invoice
+from clockify_invoice.store import InvoiceNumberError
+from clockify_invoice.store import Store
+
+
+def _invoice(store, number, month=1):
+    return Invoice(
+        number,
+        store.config.COMPANY,
+        store.config.CLIENT,
+        date(2023, month, 1),
+        date(2023, month + 1, 1),
+    )
+
+
+def test_concurrent_reservations_get_different_numbers(store):
+    # Separate stores on the same db, as in separate server workers
+    stores = [store, Store()]
+    barrier = threading.Barrier(len(stores))
+    numbers = []
+
+    def reserve(store):
+        barrier.wait()
+        for _ in range(10):
+            numbers.append(store.reserve_invoice_number())
+
+    threads = [threading.Thread(target=reserve, args=(s,)) for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(numbers) == list(range(1, 21))
+
+
+def test_released_number_is_reserved_again(store):
+    first = store.reserve_invoice_number()
+    second = store.reserve_invoice_number()
+    store.release_invoice_number(first)
+
+    assert store.reserve_invoice_number() == first
+    assert store.reserve_invoice_number() == second + 1
+
+
+def test_expired_reservation_is_reserved_again(store):
+    number = store.reserve_invoice_number()
+    expired = datetime.now() - Store._RESERVATION_TTL - timedelta(minutes=1)
+    with store.connect() as db:
+        db.execute(
+            "UPDATE invoice_reservation SET reserved_at = ? WHERE number = ?",
+            (expired.strftime(Store._DATE_FORMAT), number),
+        )
+
+    assert store.reserve_invoice_number() == number
+
+
+def test_live_reservation_is_not_reserved_again(store):
+    number = store.reserve_invoice_number()
+
+    assert store.reserve_invoice_number() == number + 1
+
+
+@pytest.mark.usefixtures("request_context")
+def test_saving_a_used_number_raises(store):
+    number = store.reserve_invoice_number()
+    store.save_invoice(_invoice(store, number))
+
+    with pytest.raises(InvoiceNumberError):
+        store.save_invoice(_invoice(store, number, month=2))
+    assert [i["invoice_number"] for i in store.get_invoices(2022)] == [number]
+
+
+@pytest.mark.usefixtures("request_context")
+def test_saving_an_archived_number_raises(store):
+    number = store.reserve_invoice_number()
+    store.save_invoice(_invoice(store, number))
+    store.archive_financial_year(2022)
+
+    with pytest.raises(InvoiceNumberError):
+        store.save_invoice(_invoice(store, number, month=2))
+    with store.connect() as db:
+        assert db.execute("SELECT COUNT(*) FROM invoice").fetchone()[0] == 0
+
+
+@pytest.mark.usefixtures("request_context")
+def test_saved_number_is_not_reserved_again(store):
+    number = store.reserve_invoice_number()
+    store.save_invoice(_invoice(store, number))
+    store.release_invoice_number(number)
+
+    assert store.reserve_invoice_number() == number + 1
+
+
+@pytest.mark.usefixtures("request_context")
+def test_deleting_the_latest_invoice_frees_its_number(store):
+    for month in (1, 2):
+        store.save_invoice(_invoice(store, store.reserve_invoice_number(), month))
+    latest = max(store.get_invoices(2022), key=lambda i: i["invoice_number"])
+
+    store.delete_invoice(latest["invoice_id"])
+
+    assert store.get_next_invoice_number() == 2
+    assert store.reserve_invoice_number() == 2
+
+
+@pytest.mark.usefixtures("request_context")
+def test_deleting_an_earlier_invoice_keeps_the_sequence(store):
+    for month in (1, 2):
+        store.save_invoice(_invoice(store, store.reserve_invoice_number(), month))
+    first = min(store.get_invoices(2022), key=lambda i: i["invoice_number"])
+
+    store.delete_invoice(first["invoice_id"])
+
+    assert store.get_next_invoice_number() == 3
+
+
+def _entry(id, start, minutes, description):
+    end = start + timedelta(minutes=minutes)
+    return (
+        id,
+        start.strftime(Store._DATE_FORMAT),
+        end.strftime(Store._DATE_FORMAT),
+        minutes * 60,
+        description,
+        "user",
+        "workspace",
+    )
+
+
+_USER = ("user", "User", "user@example.com", "workspace", "workspace", "UTC")
+
+
+@pytest.fixture
+def user_store(store):
+    """A store with the user and workspace of _entry rows, as after a synch"""
+    with store.connect() as db:
+        db.execute("INSERT INTO workspace VALUES('workspace', 'Workspace')")
+        db.execute("INSERT INTO user VALUES(?,?,?,?,?,?)", _USER)
+    return store
+
+
+def test_synch_keeps_imported_entries_it_does_not_duplicate(store):
+    start = datetime(2023, 5, 1, 9)
+    store.import_time_entries(
+        [
+            _entry("csv-synched", start, 30, "meeting"),
+            _entry("csv-offline", start + timedelta(hours=1), 30, "meeting"),
+            _entry("deleted-in-clockify", start + timedelta(hours=2), 30, "review"),
+        ]
+    )
+
+    with store.connect() as db:
+        store.stage_clockify_tables(db)
+        db.execute("INSERT INTO workspace VALUES('workspace', 'Workspace')")
+        db.execute("INSERT INTO user VALUES(?,?,?,?,?,?)", _USER)
+        # Clockify has seconds the CSV export doesn't
+        synched = _entry("clockify", start + timedelta(seconds=12), 30, "meeting")
+        db.execute("INSERT INTO time_entry VALUES(?,?,?,?,?,?,?)", synched)
+        store.commit_clockify_tables(db)
+
+    with store.connect() as db:
+        ids = {row[0] for row in db.execute("SELECT id FROM time_entry")}
+    assert ids == {"clockify", "csv-offline"}
+
+
+# The schema time entries had before descriptions moved to the description table
+_LEGACY_SCHEMA = """\
+CREATE TABLE workspace (
+    id TEXT PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE user (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    email TEXT,
+    default_workspace TEXT,
+    active_workspace TEXT,
+    time_zone TEXT
+);
+CREATE TABLE time_entry (
+    id TEXT PRIMARY KEY,
+    start_time TEXT,
+    end_time TEXT,
+    duration_seconds INT,
+    description TEXT,
+    user TEXT,
+    workspace TEXT
+);
+CREATE INDEX time_entry_user_workspace_start
+ON time_entry(user, workspace, start_time);
+CREATE TABLE archive (
+    financial_year INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE time_entry_fts USING fts5(
+    description,
+    content='time_entry',
+    content_rowid='rowid'
+);
+CREATE TRIGGER time_entry_fts_insert
+AFTER INSERT ON time_entry BEGIN
+    INSERT INTO time_entry_fts(rowid, description)
+    VALUES (new.rowid, new.description);
+END;
+CREATE TRIGGER time_entry_fts_delete
+AFTER DELETE ON time_entry BEGIN
+    INSERT INTO time_entry_fts(time_entry_fts, rowid, description)
+    VALUES ('delete', old.rowid, old.description);
+END;
+CREATE TRIGGER time_entry_fts_update
+AFTER UPDATE OF description ON time_entry BEGIN
+    INSERT INTO time_entry_fts(time_entry_fts, rowid, description)
+    VALUES ('delete', old.rowid, old.description);
+    INSERT INTO time_entry_fts(rowid, description)
+    VALUES (new.rowid, new.description);
+END;
+INSERT INTO workspace VALUES('workspace', 'Workspace');
+INSERT INTO user VALUES(
+    'user', 'User', 'user@example.com', 'workspace', 'workspace', 'UTC'
+);
+"""
+
+_LEGACY_DESCRIPTIONS = ("client meeting", "deploy api", "", None)
+_LEGACY_ARCHIVE_DESCRIPTIONS = ("client review", "deploy api", "archived task")
+
+_SEARCHES = ("client", "deploy api", "task", "meet*")
+
+
+def _legacy_rows(prefix, year, descriptions):
+    """A few entries a month, every description used more than once"""
+    rows = []
+    for i in range(24):
+        month = 1 + i % 12
+        start = datetime(year, month, 1 + i % 20, 9)
+        end = start + timedelta(minutes=15 * (1 + i % 8))
+        rows.append(
+            (
+                f"{prefix}-{i}",
+                start.strftime(Store._DATE_FORMAT),
+                end.strftime(Store._DATE_FORMAT),
+                (end - start).total_seconds(),
+                descriptions[i % len(descriptions)],
+                "user",
+                "workspace",
+            )
+        )
+    return rows
+
+
+def _create_legacy_db(path, rows):
+    """Creates a legacy db of the rows and returns the ids each search matches"""
+    with contextlib.closing(sqlite3.connect(path)) as db, db:
+        db.executescript(_LEGACY_SCHEMA)
+        db.executemany("INSERT INTO time_entry VALUES(?,?,?,?,?,?,?)", rows)
+        searches = {
+            search: {
+                row[0]
+                for row in db.execute(
+                    "SELECT te.id FROM time_entry_fts "
+                    "JOIN time_entry te ON te.rowid = time_entry_fts.rowid "
+                    "WHERE time_entry_fts MATCH ?",
+                    (search,),
+                )
+            }
+            for search in _SEARCHES
+        }
+    return searches
+
+
+def _totals(rows):
+    """The hours per description and last end time of invoice time entries"""
+    totals: dict[str, tuple[str, float]] = {}
+    for _, _, end_time, duration_seconds, description, _, _ in rows:
+        last_end, hours = totals.get(str(description), ("", 0.0))
+        totals[str(description)] = (
+            max(last_end, end_time),
+            hours + duration_seconds / 3600,
+        )
+    return totals
+
+
+def _time_entry_totals(time_entries):
+    """The same as _totals from Store.get_time_entries"""
+    return {
+        t.description: (t.date.strftime(Store._DATE_FORMAT), t.duration_hours)
+        for t in time_entries
+    }
+
+
+@pytest.fixture
+def legacy_home(home):
+    """
+    A store directory with a legacy main db (2023) and a legacy archive of the
+    2021 financial year, returning their rows and search matches
+    """
+    rows = _legacy_rows("main", 2023, _LEGACY_DESCRIPTIONS)
+    archive_rows = _legacy_rows("archived", 2022, _LEGACY_ARCHIVE_DESCRIPTIONS)
+    archive_rows = [row for row in archive_rows if row[1] < "2022-07-01"]
+    searches = _create_legacy_db(home / "db.db", rows)
+    (home / "archive").mkdir()
+    archive_searches = _create_legacy_db(home / "archive" / "fy2021.db", archive_rows)
+    with contextlib.closing(sqlite3.connect(home / "db.db")) as db, db:
+        db.execute(
+            "INSERT INTO archive VALUES(2021, 'fy2021.db', '2021-07-01', '2022-07-01')"
+        )
+    return (
+        rows,
+        archive_rows,
+        {search: searches[search] | archive_searches[search] for search in _SEARCHES},
+    )
+
+
+def _export_rows(rows):
+    """The rows as Store.iter_time_entries exports them"""
+    return [row[:5] for row in sorted(rows, key=lambda row: (row[1], row[0]))]
+
+
+def test_migrating_descriptions_keeps_totals_and_search_results(legacy_home):
+    rows, archive_rows, searches = legacy_home
+
+    store = Store()
+
+    year = store.get_time_entries(date(2023, 1, 1), date(2024, 1, 1))
+    assert _time_entry_totals(year) == _totals(rows)
+    exported = store.iter_time_entries(date(2023, 1, 1), date(2024, 1, 1))
+    assert list(exported) == _export_rows(rows)
+    for search, ids in searches.items():
+        results = store.search_time_entries(search, limit=100)
+        assert {result["id"] for result in results} == ids
+    with store.connect() as db:
+        columns = [row[1] for row in db.execute("PRAGMA table_info(time_entry)")]
+        assert "description" not in columns
+        assert db.execute("SELECT COUNT(*) FROM description").fetchone()[0] == 5
+
+
+def test_migrating_descriptions_migrates_archives(legacy_home):
+    rows, archive_rows, _ = legacy_home
+
+    store = Store()
+
+    archived = store.get_time_entries(date(2022, 1, 1), date(2022, 7, 1))
+    assert _time_entry_totals(archived) == _totals(archive_rows)
+    exported = store.iter_time_entries(date(2022, 1, 1), date(2022, 7, 1))
+    assert list(exported) == _export_rows(archive_rows)
+    with store.connect(os.path.join(store.archive_directory, "fy2021.db")) as db:
+        columns = [row[1] for row in db.execute("PRAGMA table_info(time_entry)")]
+        descriptions = dict(db.execute("SELECT id, text FROM description"))
+    assert "description" not in columns
+    # The archive keeps copies of its descriptions with the main db's ids
+    assert set(descriptions.values()) == set(_LEGACY_ARCHIVE_DESCRIPTIONS)
+    with store.connect() as db:
+        main_descriptions = dict(db.execute("SELECT id, text FROM description"))
+    assert descriptions.items() <= main_descriptions.items()
+
+
+def test_migrating_descriptions_twice_changes_nothing(legacy_home):
+    store = Store()
+    generation = store.get_generation()
+
+    Store()
+
+    assert store.get_generation() == generation
+
+
+def test_search_orders_matches_across_archives_by_date(legacy_home):
+    _, _, searches = legacy_home
+    store = Store()
+
+    results = store.search_time_entries("deploy api", limit=100)
+
+    dates = [result["date"] for result in results]
+    assert dates == sorted(dates, reverse=True)
+    assert {result["id"] for result in results} == searches["deploy api"]
+    latest = store.search_time_entries("deploy api", limit=3, offset=2)
+    assert [result["id"] for result in latest] == [r["id"] for r in results[2:5]]
+
+
+@pytest.mark.parametrize("batch_size", (1, 5, 24, 1000))
+def test_export_pages_through_the_archives(legacy_home, batch_size):
+    rows, archive_rows, _ = legacy_home
+    store = Store()
+
+    exported = store.iter_time_entries(
+        date(2021, 7, 1), date(2024, 1, 1), batch_size=batch_size
+    )
+
+    assert list(exported) == _export_rows(archive_rows + rows)
+
+
+def test_export_pages_through_entries_starting_together(user_store):
+    start = datetime(2023, 5, 1, 9)
+    rows = [_entry(f"entry-{i}", start, 15, "meeting") for i in range(7)]
+    rows += [_entry("later", start + timedelta(hours=1), 15, "review")]
+    user_store.import_time_entries(reversed(rows))
+
+    exported = user_store.iter_time_entries(date(2023, 5, 1), date(2023, 5, 2), 3)
+
+    assert list(exported) == _export_rows(rows)
+
+
+def test_export_does_not_block_writers_between_pages(user_store):
+    start = datetime(2023, 5, 1, 9)
+    user_store.import_time_entries(
+        [_entry(f"entry-{i}", start, 15, "meeting") for i in range(3)]
+    )
+    exported = user_store.iter_time_entries(date(2023, 5, 1), date(2023, 5, 2), 1)
+    next(exported)
+
+    # Fails at once if the export still holds a read lock
+    with user_store.connect() as db:
+        db.execute("PRAGMA busy_timeout = 0")
+        db.execute("BEGIN EXCLUSIVE")
+
+    assert [row[0] for row in exported] == ["entry-1", "entry-2"]
+
+
+@pytest.mark.usefixtures("request_context")
+@pytest.mark.parametrize("batch_size", (1, 2, 1000))
+def test_invoice_export_pages_by_period_and_number(store, batch_size):
+    # Two invoices for March so a page boundary falls between them
+    for number, month in ((4, 3), (1, 1), (3, 3), (2, 2), (5, 4)):
+        store.save_invoice(_invoice(store, number, month))
+
+    exported = store.iter_invoice_summaries(
+        date(2023, 1, 1), date(2023, 4, 1), batch_size=batch_size
+    )
+
+    assert [(row[1], row[3]) for row in exported] == [
+        (1, "2023-01-01"),
+        (2, "2023-02-01"),
+        (3, "2023-03-01"),
+        (4, "2023-03-01"),
+    ]